@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Downloads every feature from an ArcGIS feature service layer (a URL like
+# https://services1.arcgis.com/.../FeatureServer/0) to outputPath, without
+# holding the whole layer in memory. The object IDs are split into pages of
+# consecutive IDs, fetched by a few threads at once. Each page is written to its
+# own GeoJSONSeq file in {outputPath}.parts as soon as it arrives, so if
+# something fails, calling this again only fetches the missing pages. The
+# pages are finally concatenated in order, as GeoJSONSeq if outputPath ends in
+# .geojsonl or .geojsons, or otherwise as a FeatureCollection that readFeatures
+# can stream.
+def downloadFeatureLayer(layerUrl, outputPath, pageSize=1000, workers=4, retries=3):
+    partsDirectory = f"{outputPath}.parts"
+    os.makedirs(partsDirectory, exist_ok=True)
+
+    # Keep the pages from the first attempt, so a resumed download asks for
+    # exactly the same ranges
+    pagesPath = f"{partsDirectory}/pages.json"
+    if os.path.exists(pagesPath):
+        with open(pagesPath) as f:
+            idField, pages = json.load(f)
+    else:
+        idField, ids = getObjectIds(layerUrl)
+        pages = [
+            (ids[i], ids[min(i + pageSize, len(ids)) - 1])
+            for i in range(0, len(ids), pageSize)
+        ]
+        with open(pagesPath, "w") as f:
+            json.dump([idField, pages], f)
+
+    def partPath(pageNumber):
+        return f"{partsDirectory}/{pageNumber:06}.geojsonl"
+
+    missing = [i for i in range(len(pages)) if not os.path.exists(partPath(i))]
+    print(
+        f"Downloading {len(missing)} of {len(pages)} pages of {layerUrl} to {outputPath}"
+    )
+
+    def downloadPage(pageNumber):
+        minID, maxID = pages[pageNumber]
+        features = queryPage(layerUrl, idField, minID, maxID, retries)
+        # Only completed pages get their final name
+        with open(f"{partPath(pageNumber)}.partial", "w") as f:
+            for feature in features:
+                f.write(json.dumps(feature, separators=(",", ":")))
+                f.write("\n")
+        os.replace(f"{partPath(pageNumber)}.partial", partPath(pageNumber))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(downloadPage, pageNumber) for pageNumber in missing]
+    # Raise the first error, after every other page has had a chance to finish.
+    # (Iterating over pool.map would cancel pages that haven't started yet.)
+    for future in futures:
+        future.result()
+
+    sequence = outputPath.endswith(".geojsonl") or outputPath.endswith(".geojsons")
+    with open(outputPath, "w") as output:
+        if not sequence:
+            output.write('{"type":"FeatureCollection","features":[\n')
+        first = True
+        for pageNumber in range(len(pages)):
+            with open(partPath(pageNumber)) as f:
+                for line in f:
+                    if not sequence and not first:
+                        output.write(",\n")
+                    output.write(line.rstrip("\n") if not sequence else line)
+                    first = False
+        if not sequence:
+            output.write("\n]}\n")
+    shutil.rmtree(partsDirectory)
+
+
+# Returns the name of the object ID field and a sorted list of all IDs
+def getObjectIds(layerUrl):
+    response = getJson(
+        f"{layerUrl}/query", {"where": "1=1", "returnIdsOnly": "true", "f": "json"}
+    )
+    return response["objectIdFieldName"], sorted(response["objectIds"] or [])
+
+
+# Returns the features with IDs from minID to maxID, inclusive, in WGS84
+def queryPage(layerUrl, idField, minID, maxID, retries):
+    params = {
+        "where": f"{idField}>={minID} AND {idField}<={maxID}",
+        "outFields": "*",
+        "outSR": "4326",
+        "f": "geojson",
+    }
+    for attempt in range(retries):
+        try:
+            response = getJson(f"{layerUrl}/query", params)
+            break
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            print(f"Retrying IDs {minID} to {maxID} after error: {e}")
+            time.sleep(2**attempt)
+
+    # The service caps how many features one query returns
+    if response.get("exceededTransferLimit") or response.get("properties", {}).get(
+        "exceededTransferLimit"
+    ):
+        raise Exception(
+            f"IDs {minID} to {maxID} exceeded the service's limit; use a smaller pageSize"
+        )
+    return response["features"]
+
+
+# Returns the URL of one layer of an ArcGIS Online item
+def findLayerUrl(itemId, layer=0):
+    item = getJson(
+        f"https://www.arcgis.com/sharing/rest/content/items/{itemId}", {"f": "json"}
+    )
+    return f"{item['url']}/{layer}"
+
+
+# Returns when a layer was last edited, in milliseconds since the epoch, or
+# None if the service doesn't say
+def getLastEditDate(layerUrl):
+    return getJson(layerUrl, {"f": "json"}).get("editingInfo", {}).get("lastEditDate")
+
+
+def getJson(url, params):
+    url = f"{url}?{urllib.parse.urlencode(params)}"
+    with urllib.request.urlopen(url, timeout=300) as response:
+        result = json.load(response)
+    # Errors are often reported with a 200 status code
+    if "error" in result:
+        raise Exception(f"{url} failed: {result['error']}")
+    return result
@@ -0,0 +1,101 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from arcgis_download import downloadFeatureLayer
+from utils import readFeatures
+
+
+# Mimics the query endpoint of an ArcGIS feature service layer with 25 point
+# features, and IDs that skip a few numbers
+class FakeFeatureService(BaseHTTPRequestHandler):
+    ids = [i for i in range(1, 31) if i % 6 != 0]
+    # Page minimum IDs to fail once
+    failOnce = set()
+    requests = []
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        FakeFeatureService.requests.append(params)
+
+        if params.get("returnIdsOnly") == "true":
+            # Real services don't return these in order
+            body = {"objectIdFieldName": "FID", "objectIds": self.ids[::-1]}
+        else:
+            minID, maxID = map(
+                int,
+                re.fullmatch(r"FID>=(\d+) AND FID<=(\d+)", params["where"]).groups(),
+            )
+            if minID in FakeFeatureService.failOnce:
+                FakeFeatureService.failOnce.remove(minID)
+                body = {"error": {"code": 500, "message": "Try again later"}}
+            else:
+                body = {
+                    "type": "FeatureCollection",
+                    "features": [
+                        {
+                            "type": "Feature",
+                            "id": i,
+                            "properties": {"FID": i},
+                            "geometry": {"type": "Point", "coordinates": [i, 0]},
+                        }
+                        for i in self.ids
+                        if minID <= i <= maxID
+                    ],
+                }
+
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadFeatureLayer(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeFeatureService)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.layerUrl = f"http://127.0.0.1:{self.server.server_port}/FeatureServer/0"
+        self.tmp = tempfile.TemporaryDirectory()
+        FakeFeatureService.requests = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_download(self):
+        for name in ["out.geojson", "out.geojsonl"]:
+            path = os.path.join(self.tmp.name, name)
+            downloadFeatureLayer(self.layerUrl, path, pageSize=4, workers=3)
+            ids = [feature["properties"]["FID"] for feature in readFeatures(path)]
+            self.assertEqual(ids, FakeFeatureService.ids)
+            self.assertFalse(os.path.exists(f"{path}.parts"))
+
+    def test_resume(self):
+        path = os.path.join(self.tmp.name, "out.geojsonl")
+        # The third page is IDs 10, 11, 13, and 14
+        FakeFeatureService.failOnce = {10}
+        with self.assertRaises(Exception):
+            downloadFeatureLayer(self.layerUrl, path, pageSize=4, retries=1)
+
+        # Only the failed page is fetched again
+        FakeFeatureService.requests = []
+        downloadFeatureLayer(self.layerUrl, path, pageSize=4, retries=1)
+        self.assertEqual(
+            [params["where"] for params in FakeFeatureService.requests],
+            ["FID>=10 AND FID<=14"],
+        )
+        ids = [feature["properties"]["FID"] for feature in readFeatures(path)]
+        self.assertEqual(ids, FakeFeatureService.ids)
+
+
+if __name__ == "__main__":
+    unittest.main()
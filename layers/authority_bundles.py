@@ -0,0 +1,110 @@
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import *
+from spatial_index import clipLine, loadAuthorities
+
+# Small point and line layers worth splitting per authority. Polygon layers and
+# huge line layers like cycle_paths stay national.
+bundledLayers = [
+    "bus_routes",
+    "cycle_parking",
+    "national_cycle_network",
+    "railway_stations",
+    "trams",
+    "vehicle_counts",
+]
+
+
+# Clips a layer to every polygon in authorities.geojson, writing
+# {outputDirectory}/{areaSlug}/{layerName}.geojson. The frontend can fetch
+# these small files for one area, instead of range-reading national files.
+def makeBundles(layerName, geojsonPath, outputDirectory="output/areas"):
+    if layerName not in bundledLayers:
+        return
+    print(f"Splitting {layerName} per authority")
+
+    # Stream the layer once, using the spatial index to find the features
+    # possibly in each authority
+    authorities = loadAuthorities()
+    perAuthority = defaultdict(list)
+    for feature in readFeatures(geojsonPath):
+        geometry = feature["geometry"]
+        if geometry["type"] == "Point":
+            coordinates = geometry["coordinates"]
+            matches = authorities.lookupPoint(coordinates[0], coordinates[1])
+        else:
+            matches = authorities.candidates(bbox(geometry))
+        for idx in matches:
+            perAuthority[idx].append(feature)
+
+    # Clip each authority in parallel
+    jobs = [
+        (layerName, idx, perAuthority[idx], outputDirectory)
+        for idx in range(len(authorities.properties))
+    ]
+    with ProcessPoolExecutor(initializer=loadAuthorities) as pool:
+        for _ in pool.map(writeBundle, jobs, chunksize=4):
+            pass
+
+
+def writeBundle(job):
+    layerName, idx, features, outputDirectory = job
+    authorities = loadAuthorities()
+    polygons = authorities.polygons[idx]
+    props = authorities.properties[idx]
+
+    clipped = []
+    for feature in features:
+        geometry = feature["geometry"]
+        if geometry["type"] == "LineString":
+            lines = clipLine(geometry["coordinates"], polygons)
+        elif geometry["type"] == "MultiLineString":
+            lines = [
+                piece
+                for line in geometry["coordinates"]
+                for piece in clipLine(line, polygons)
+            ]
+        else:
+            clipped.append(feature)
+            continue
+
+        if len(lines) == 1:
+            geometry = {"type": "LineString", "coordinates": lines[0]}
+        elif lines:
+            geometry = {"type": "MultiLineString", "coordinates": lines}
+        else:
+            continue
+        clipped.append(dict(feature, geometry=geometry))
+
+    directory = os.path.join(outputDirectory, areaSlug(props))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{layerName}.geojson"), "w") as f:
+        f.write(
+            json.dumps(
+                {"type": "FeatureCollection", "features": clipped},
+                separators=(",", ":"),
+            )
+        )
+
+
+# A directory name safe to use in URLs and S3 keys, like
+# "lad_brighton_and_hove" or "ta_kings_lynn_and_west_norfolk"
+def areaSlug(props):
+    name = f"{props['level']} {props['name']}".replace("&", " and ")
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    name = name.lower().replace("'", "")
+    return re.sub(r"[^a-z0-9]+", "_", name).strip("_")
+
+
+def bbox(geometry):
+    coordinates = geometry["coordinates"]
+    while isinstance(coordinates[0][0], list):
+        coordinates = [pt for part in coordinates for pt in part]
+    xs = [pt[0] for pt in coordinates]
+    ys = [pt[1] for pt in coordinates]
+    return (min(xs), min(ys), max(xs), max(ys))
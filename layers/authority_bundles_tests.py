@@ -0,0 +1,18 @@
+import unittest
+
+from authority_bundles import areaSlug
+
+
+class TestAreaSlug(unittest.TestCase):
+    def test_areaSlug(self):
+        for name, slug in [
+            ("King's Lynn and West Norfolk", "lad_kings_lynn_and_west_norfolk"),
+            ("Brighton & Hove", "lad_brighton_and_hove"),
+            ("Bristol, City of", "lad_bristol_city_of"),
+            ("Ynys Môn", "lad_ynys_mon"),
+        ]:
+            self.assertEqual(areaSlug({"level": "LAD", "name": name}), slug)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import json
+import math
+import os
+from collections import defaultdict
+
+from utils import *
+from spatial_index import loadAuthorities
+
+
+# Summarizes layers per authority in authorities.geojson, so the frontend
+# doesn't have to work this out from vector tiles. Each layer's GeoJSON is
+# streamed once. The output is keyed by "{level}_{name}", then by layer.
+class AuthorityStats:
+    def __init__(self, path):
+        self.path = path
+        self.stats = defaultdict(dict)
+        # Keep summaries of layers not rebuilt this time
+        if os.path.exists(path):
+            with open(path) as f:
+                self.stats.update(json.load(f))
+
+    def summarizeLayer(self, layerName, geojsonPath):
+        summarize = summarizers.get(layerName)
+        if not summarize:
+            return
+        print(f"Summarizing {layerName} per authority")
+
+        authorities = loadAuthorities()
+        perAuthority = summarize(authorities, readFeatures(geojsonPath))
+        for idx, props in enumerate(authorities.properties):
+            key = f"{props['level']}_{props['name']}"
+            self.stats[key][layerName] = perAuthority.get(idx, {})
+
+    def write(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps(self.stats, separators=(",", ":"), sort_keys=True))
+
+
+# Adds up the length in km of lines per category. Each segment is counted in
+# the authorities containing its midpoint. categories takes properties and
+# returns a list of category names.
+def sumLengths(authorities, features, categories):
+    totals = defaultdict(lambda: defaultdict(float))
+    for feature in features:
+        keys = categories(feature["properties"])
+        if not keys:
+            continue
+        geometry = feature["geometry"]
+        if geometry["type"] == "LineString":
+            lines = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiLineString":
+            lines = geometry["coordinates"]
+        else:
+            continue
+
+        for line in lines:
+            for a, b in zip(line, line[1:]):
+                length = distanceKm(a, b)
+                for idx in authorities.lookupPoint(
+                    (a[0] + b[0]) / 2, (a[1] + b[1]) / 2
+                ):
+                    for key in keys:
+                        totals[idx][key] += length
+
+    return {
+        idx: {key: round(value, 2) for key, value in values.items()}
+        for idx, values in totals.items()
+    }
+
+
+# Adds up values per feature. Each feature is counted once per authority level,
+# using one point for non-point geometry. values takes properties and returns
+# a dictionary of numbers to add.
+def sumValues(authorities, features, values):
+    totals = defaultdict(lambda: defaultdict(int))
+    for feature in features:
+        x, y = representativeCoordinate(feature["geometry"])
+        for idx in authorities.lookupPoint(x, y):
+            for key, value in values(feature["properties"]).items():
+                totals[idx][key] += value
+    return {idx: dict(values) for idx, values in totals.items()}
+
+
+def summarizeVehicleCounts(authorities, features):
+    result = sumValues(
+        authorities,
+        features,
+        lambda props: {
+            "count_points": 1,
+            "motor_vehicles": props["motor_vehicles"],
+            "pedal_cycles": props["pedal_cycles"],
+        },
+    )
+    # Totals of daily flows at unrelated points aren't meaningful, so average
+    for summary in result.values():
+        for key in ["motor_vehicles", "pedal_cycles"]:
+            summary[f"mean_{key}"] = round(summary.pop(key) / summary["count_points"])
+    return result
+
+
+summarizers = {
+    "cycle_paths": lambda authorities, features: sumLengths(
+        authorities, features, lambda props: [f"{props['kind']}_km"]
+    ),
+    "bus_routes": lambda authorities, features: sumLengths(
+        authorities,
+        features,
+        lambda props: (
+            ["route_km", "bus_lane_km"] if props.get("has_bus_lane") else ["route_km"]
+        ),
+    ),
+    "cycle_parking": lambda authorities, features: sumValues(
+        authorities,
+        features,
+        lambda props: {"count": 1, "capacity": props.get("capacity", 0)},
+    ),
+    "education": lambda authorities, features: sumValues(
+        authorities, features, lambda props: {"count": 1, props["type"]: 1}
+    ),
+    "hospitals": lambda authorities, features: sumValues(
+        authorities, features, lambda props: {"count": 1}
+    ),
+    "railway_stations": lambda authorities, features: sumValues(
+        authorities, features, lambda props: {"count": 1}
+    ),
+    "vehicle_counts": summarizeVehicleCounts,
+}
+
+
+# One point somewhere on a geometry. For polygons, the middle of the outer
+# ring's bounding box.
+def representativeCoordinate(geometry):
+    coordinates = geometry["coordinates"]
+    if geometry["type"] == "Point":
+        return coordinates[0], coordinates[1]
+    while isinstance(coordinates[0][0], list):
+        coordinates = coordinates[0]
+    xs = [pt[0] for pt in coordinates]
+    ys = [pt[1] for pt in coordinates]
+    return (min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2
+
+
+# Haversine distance between two [lon, lat] points
+def distanceKm(a, b):
+    lon1, lat1, lon2, lat2 = map(math.radians, [a[0], a[1], b[0], b[1]])
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
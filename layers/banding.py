@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+
+# Turns long census data, with one row per area and category, into one row per
+# area and one column per category. Any number of categories is handled, and
+# missing combinations become 0.
+def pivotCategories(df, areaColumn, categoryColumn, valueColumn):
+    return df.pivot_table(
+        index=areaColumn,
+        columns=categoryColumn,
+        values=valueColumn,
+        aggfunc="sum",
+        fill_value=0,
+    )
+
+
+# Gives each value the 1-based number of the first band whose inclusive upper
+# bound it's below. upperBounds must be sorted. Values above the last bound, or
+# missing, get default, or one more than the number of bounds if that's None.
+def band(values, upperBounds, default=None):
+    values = np.asarray(values, dtype=float)
+    bands = np.searchsorted(np.asarray(upperBounds, dtype=float), values) + 1
+    if default is not None:
+        bands[(bands > len(upperBounds)) | np.isnan(values)] = default
+    return bands
+
+
+# Splits values into quantiles numbered from 0, dropping duplicate edges when
+# lots of values are equal
+def deciles(values, q=10):
+    return pd.qcut(values, q=q, labels=False, duplicates="drop")
+
+
+# Compares the old per-category filtering against pivotCategories and band,
+# with random data the size of England and Wales' 2021 output areas
+if __name__ == "__main__":
+    import time
+
+    numAreas = 188880
+    categories = [-8, 0, 1, 2, 3]
+    rng = np.random.default_rng(42)
+    raw = pd.DataFrame(
+        {
+            "Output Areas Code": np.repeat(
+                [f"E{i:08}" for i in range(numAreas)], len(categories)
+            ),
+            "Car or van availability (5 categories) Code": np.tile(
+                categories, numAreas
+            ),
+            "Observation": rng.integers(0, 100, numAreas * len(categories)),
+        }
+    )
+    areaColumn = "Output Areas Code"
+    categoryColumn = "Car or van availability (5 categories) Code"
+
+    start = time.time()
+    old = pd.DataFrame(index=raw[areaColumn].value_counts().index)
+    for code in [0, 1, 2, 3]:
+        old[code] = raw[raw[categoryColumn] == code][
+            [areaColumn, "Observation"]
+        ].set_index(areaColumn)
+    old["Total"] = raw.groupby(areaColumn).sum()["Observation"]
+    old["Bands"] = np.select(
+        [(1 - old[0] / old["Total"]) <= bound for bound in [0.4, 0.6, 0.8, 1]],
+        [1, 2, 3, 4],
+        default=99,
+    )
+    print(f"Filtering per category: {time.time() - start:.2f}s")
+
+    start = time.time()
+    counts = pivotCategories(raw, areaColumn, categoryColumn, "Observation")
+    bands = band(1 - counts[0] / counts.sum(axis=1), [0.4, 0.6, 0.8, 1], default=99)
+    print(f"pivotCategories and band: {time.time() - start:.2f}s")
+    same = (old["Bands"].loc[counts.index].to_numpy() == bands).all()
+    print(f"Same bands as before: {same}")
+
+    start = time.time()
+    deciles(rng.random(numAreas))
+    print(f"deciles: {time.time() - start:.2f}s")
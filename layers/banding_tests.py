@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from banding import band, deciles, pivotCategories
+
+
+class TestBanding(unittest.TestCase):
+    def test_band(self):
+        bounds = [0.4, 0.6, 0.8, 1]
+        # Upper bounds are inclusive
+        self.assertEqual(
+            band([0, 0.4, 0.41, 0.6, 0.8, 1], bounds).tolist(), [1, 1, 2, 2, 3, 4]
+        )
+        # Above the last bound, or missing
+        self.assertEqual(band([1.5, np.nan], bounds).tolist(), [5, 5])
+        self.assertEqual(
+            band([1.5, np.nan, 0.5], bounds, default=99).tolist(), [99, 99, 2]
+        )
+
+    def test_pivotCategories(self):
+        raw = pd.DataFrame(
+            {
+                "area": ["a", "a", "a", "b"],
+                "category": [0, 1, 1, 2],
+                "count": [5, 3, 4, 7],
+            }
+        )
+        counts = pivotCategories(raw, "area", "category", "count")
+        self.assertEqual(counts.index.tolist(), ["a", "b"])
+        self.assertEqual(counts.columns.tolist(), [0, 1, 2])
+        # Repeated rows are summed, and missing combinations are 0
+        self.assertEqual(counts.to_numpy().tolist(), [[5, 7, 0], [0, 0, 7]])
+
+    def test_deciles(self):
+        self.assertEqual(
+            deciles(list(range(20)), q=4).tolist(),
+            [0] * 5 + [1] * 5 + [2] * 5 + [3] * 5,
+        )
+        # Duplicate edges from equal values are merged, instead of failing
+        self.assertEqual(deciles([1, 1, 1, 1, 2], q=4).tolist(), [0, 0, 0, 0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
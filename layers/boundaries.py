@@ -1,10 +1,26 @@
+import heapq
+import math
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from utils import *
 
+# Outputs made from OS BoundaryLine, with the SQL picking each one's fields
+# from the GeoPackage. Only England is kept.
+boundaryLineLayers = {
+    output: f"SELECT Name, Census_Code, geometry FROM {layer} WHERE Census_Code LIKE 'E%'"
+    for output, layer in [
+        ("parliamentary_constituencies", "westminster_const"),
+        ("district_borough_unitary", "district_borough_unitary"),
+        ("district_borough_unitary_ward", "district_borough_unitary_ward"),
+        ("unitary_electoral_division", "unitary_electoral_division"),
+    ]
+}
 
-def makeParliamentaryConstituencies():
-    tmp = "tmp_parliamentary_constituencies"
-    ensureEmptyTempDirectoryExists(tmp)
+
+# Makes any of the boundaryLineLayers. The GeoPackage is downloaded and
+# unzipped once, then each layer is extracted and reprojected in parallel.
+def makeBoundaryLineLayers(outputs):
+    tmp = ensureEmptyTempDirectoryExists("tmp_boundary_line", estimatedBytes=4 * GB)
 
     # Get the geopackage
     run(
@@ -16,33 +32,27 @@ def makeParliamentaryConstituencies():
             f"{tmp}/boundary_lines.zip",
         ]
     )
-    run(["unzip", f"{tmp}/boundary_lines.zip", "-d", tmp])
+    run(["unzip", f"{tmp}/boundary_lines.zip", "Data/bdline_gb.gpkg", "-d", tmp])
 
-    # Convert to GeoJSON, projecting to WGS84. Only grab one layer.
-    run(
-        [
-            "ogr2ogr",
-            "-f",
-            "GeoJSON",
-            f"{tmp}/parliamentary_constituencies.geojson",
-            "-t_srs",
-            "EPSG:4326",
+    # Convert to GeoJSON, projecting to WGS84
+    def extract(output):
+        reprojectToWgs84(
             f"{tmp}/Data/bdline_gb.gpkg",
-            "-sql",
-            # Just get a few fields from one layer, and filter for England
-            "SELECT Name, Census_Code, geometry FROM westminster_const WHERE Census_Code LIKE 'E%'",
-        ]
-    )
+            f"{tmp}/{output}.geojson",
+            sql=boundaryLineLayers[output],
+            precision=6,
+        )
 
-    convertGeoJsonToPmtiles(
-        f"{tmp}/parliamentary_constituencies.geojson",
-        "output/parliamentary_constituencies.pmtiles",
-    )
+    with ThreadPoolExecutor() as pool:
+        # Raise any errors
+        list(pool.map(extract, outputs))
+
+    for output in outputs:
+        convertGeoJsonToPmtiles(f"{tmp}/{output}.geojson", f"output/{output}.pmtiles")
 
 
 def makeWards():
-    tmp = "tmp_wards"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists("tmp_wards")
 
     run(
         [
@@ -70,7 +80,9 @@ def makeWards():
     convertGeoJsonToPmtiles(f"{tmp}/wards.geojson", "output/wards.pmtiles")
 
 
-def makeCombinedAuthorities():
+# With topojson, also write a compact copy of small outputs, using
+# writeTopoJson
+def makeCombinedAuthorities(topojson=False):
     shutil.copyfile(
         # Manually downloaded and stored in git
         "input/Combined_Authorities_May_2023_Boundaries_EN_BUC_529823327652397380.geojson",
@@ -85,11 +97,16 @@ def makeCombinedAuthorities():
 
     # The final file is tiny; don't bother with pmtiles
     cleanUpGeojson("output/combined_authorities.geojson", fixProps)
+    if topojson:
+        writeTopoJson(
+            "output/combined_authorities.geojson",
+            "output/combined_authorities.topojson",
+            "combined_authorities",
+        )
 
 
-def makeLocalAuthorityDistricts():
-    tmp = "tmp_local_authority_districts"
-    ensureEmptyTempDirectoryExists(tmp)
+def makeLocalAuthorityDistricts(topojson=False):
+    tmp = ensureEmptyTempDirectoryExists("tmp_local_authority_districts")
 
     shutil.copyfile(
         # Manually downloaded and stored in git
@@ -110,6 +127,12 @@ def makeLocalAuthorityDistricts():
         # Only keep England
         filterFeatures=lambda f: f["properties"]["LAD24CD"][0] == "E",
     )
+    if topojson:
+        writeTopoJson(
+            "output/local_authority_districts.geojson",
+            "output/local_authority_districts.topojson",
+            "local_authority_districts",
+        )
 
 
 def makeLocalAuthorityDistrictsForSketcher():
@@ -159,8 +182,7 @@ def makeTransportAuthoritiesForSketcher():
 
 
 def makeLocalPlanningAuthorities():
-    tmp = "tmp_local_planning_authorities"
-    os.makedirs(tmp, exist_ok=True)
+    tmp = ensureEmptyTempDirectoryExists("tmp_local_planning_authorities")
 
     # Alternatively, the original source here seems to be
     # https://geoportal.statistics.gov.uk/datasets/ons::local-planning-authorities-april-2022-uk-bgc-3/explore
@@ -183,3 +205,146 @@ def makeLocalPlanningAuthorities():
     cleanUpGeojson(path, fixProps)
 
     convertGeoJsonToPmtiles(path, "output/local_planning_authorities.pmtiles")
+
+
+# Replaces fix_boundaries: merges the outputs of
+# makeTransportAuthoritiesForSketcher and
+# makeLocalAuthorityDistrictsForSketcher into output/authorities.geojson, then
+# simplifies it. Shared edges are simplified once, so neighbouring authorities
+# never gap or overlap. retain is the fraction of removable vertices to keep,
+# like mapshaper's -simplify percentage.
+def makeAuthorities(retain, topojson=False):
+    makeTransportAuthoritiesForSketcher()
+    makeLocalAuthorityDistrictsForSketcher()
+
+    features = list(readFeatures("output/transport_authorities_reprojected.geojson"))
+    features.extend(
+        readFeatures("output/local_authority_districts_reprojected.geojson")
+    )
+
+    geometries, numVertices = simplifyPolygons(
+        [f["geometry"] for f in features], retain
+    )
+    for feature, geometry in zip(features, geometries):
+        feature["geometry"] = geometry
+
+    print(f"Simplified authorities to {numVertices} arc vertices")
+    writeFeatureCollection("output/authorities.geojson", features)
+    if topojson:
+        writeTopoJson(
+            "output/authorities.geojson", "output/authorities.topojson", "authorities"
+        )
+
+
+# Simplifies Polygon and MultiPolygon geometries together. Edges shared by
+# neighbouring polygons are simplified once, so they stay identical, without
+# gaps or overlaps. Returns the new geometries and the number of arc vertices.
+def simplifyPolygons(geometries, retain):
+    arcs, topology = buildArcs(geometries)
+    polygonsPerGeometry = [
+        [polygons] if geometry["type"] == "Polygon" else polygons
+        for geometry, polygons in zip(geometries, topology)
+    ]
+    rings = [
+        ring
+        for polygons in polygonsPerGeometry
+        for polygon in polygons
+        for ring in polygon
+    ]
+    arcs = simplifyArcs(arcs, rings, retain)
+
+    results = []
+    for geometry, polygons in zip(geometries, polygonsPerGeometry):
+        coordinates = [
+            [ringFromArcs(arcs, ring) for ring in polygon] for polygon in polygons
+        ]
+        if geometry["type"] == "Polygon":
+            coordinates = coordinates[0]
+        results.append({"type": geometry["type"], "coordinates": coordinates})
+    return results, sum(len(arc) for arc in arcs)
+
+
+# Visvalingam simplification of arcs from buildArcs, using one area threshold
+# across all arcs. Arc endpoints are always kept. rings is a list of every
+# ring's arc indices. Returns the simplified arcs.
+def simplifyArcs(arcs, rings, retain):
+    areas = [effectiveAreas(arc) for arc in arcs]
+    interior = sorted(
+        (area for arcAreas in areas for area in arcAreas[1:-1]), reverse=True
+    )
+    numKeep = round(len(interior) * retain)
+    threshold = interior[numKeep - 1] if numKeep > 0 else math.inf
+    keep = [[area >= threshold for area in arcAreas] for arcAreas in areas]
+
+    # Every ring needs at least 3 distinct points. Keep the most significant
+    # vertices of its arcs until it has them.
+    for ring in rings:
+        ringArcs = set(ref if ref >= 0 else ~ref for ref in ring)
+        while sum(keep[arc].count(True) - 1 for arc in ringArcs) < 3:
+            candidates = [
+                (areas[arc][i], arc, i)
+                for arc in ringArcs
+                for i in range(len(arcs[arc]))
+                if not keep[arc][i]
+            ]
+            if not candidates:
+                break
+            _, arc, i = max(candidates)
+            keep[arc][i] = True
+
+    return [
+        [pt for pt, kept in zip(arc, arcKeep) if kept]
+        for arc, arcKeep in zip(arcs, keep)
+    ]
+
+
+# Returns the Visvalingam effective area of each point in a line. The endpoints
+# get infinity.
+def effectiveAreas(points):
+    areas = [math.inf] * len(points)
+    if len(points) < 3:
+        return areas
+
+    previous = list(range(-1, len(points) - 1))
+    next = list(range(1, len(points) + 1))
+    current = [None] * len(points)
+    heap = []
+    for i in range(1, len(points) - 1):
+        current[i] = triangleArea(points[i - 1], points[i], points[i + 1])
+        heap.append((current[i], i))
+    heapq.heapify(heap)
+
+    maxArea = 0
+    while heap:
+        area, i = heapq.heappop(heap)
+        if area != current[i]:
+            # Stale entry
+            continue
+        current[i] = None
+        # A point can't be less significant than one removed before it
+        maxArea = max(maxArea, area)
+        areas[i] = maxArea
+
+        before, after = previous[i], next[i]
+        next[before] = after
+        previous[after] = before
+        for j in [before, after]:
+            if 0 < j < len(points) - 1:
+                current[j] = triangleArea(
+                    points[previous[j]], points[j], points[next[j]]
+                )
+                heapq.heappush(heap, (current[j], j))
+    return areas
+
+
+# Area of a triangle of [lon, lat] points, with longitude scaled to roughly
+# match latitude
+def triangleArea(a, b, c):
+    scale = math.cos(math.radians(b[1]))
+    return (
+        abs(
+            (a[0] - c[0]) * scale * (b[1] - c[1])
+            - (b[0] - c[0]) * scale * (a[1] - c[1])
+        )
+        / 2
+    )
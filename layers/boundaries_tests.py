@@ -0,0 +1,56 @@
+import math
+import unittest
+
+from boundaries import effectiveAreas, simplifyArcs, simplifyPolygons
+
+
+class TestSimplify(unittest.TestCase):
+    def test_effectiveAreas(self):
+        # The collinear point goes first. The corner then spans the whole
+        # triangle.
+        self.assertEqual(
+            effectiveAreas([[0, 0], [1, 0], [2, 0], [2, 2]]), [math.inf, 0, 2, math.inf]
+        )
+        # Areas never decrease in the order points are removed
+        areas = effectiveAreas([[0, 0], [1, 0], [1, 0.1], [1.1, 0.1], [1.1, 0]])
+        self.assertEqual(areas[2], areas[3])
+
+    def test_simplifyArcs(self):
+        ring = [[0, 0], [1, 0], [2, 0], [2, 2], [1, 2.01], [0, 3], [0, 0]]
+        self.assertEqual(simplifyArcs([ring], [[0]], 1), [ring])
+        # The ring keeps its endpoints, and at least 3 distinct points
+        self.assertEqual(
+            simplifyArcs([ring], [[0]], 0), [[[0, 0], [2, 0], [0, 3], [0, 0]]]
+        )
+
+    def test_shared_edge(self):
+        # Two squares sharing a zigzag edge along x = 1
+        zigzag = [[1 + 0.001 * (-1) ** i * i, i / 10] for i in range(1, 10)]
+        west = [[0, 0], [1, 0]] + zigzag + [[1, 1], [0, 1], [0, 0]]
+        east = [[1, 0], [2, 0], [2, 1], [1, 1]] + zigzag[::-1] + [[1, 0]]
+        (west, east), _ = simplifyPolygons(
+            [
+                {"type": "Polygon", "coordinates": [west]},
+                {"type": "Polygon", "coordinates": [east]},
+            ],
+            0.3,
+        )
+        westRing = west["coordinates"][0]
+        eastRing = east["coordinates"][0]
+
+        def segments(ring):
+            return set((tuple(a), tuple(b)) for a, b in zip(ring, ring[1:]))
+
+        # Every segment of the east square on the shared edge appears reversed
+        # in the west square, so they fit with no gaps or slivers
+        shared = segments(westRing) & set((b, a) for a, b in segments(eastRing))
+        edge = [(1, 0)]
+        while edge[-1] != (1, 1):
+            edge.append(next(b for a, b in shared if a == edge[-1]))
+        self.assertEqual(len(edge) - 1, len(shared))
+        # Some of the zigzag was simplified away
+        self.assertLess(len(edge), len(zigzag) + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,64 +1,109 @@
 import csv
+import io
+import os
+import zipfile
+from collections import defaultdict, namedtuple
+
 from utils import *
 
+# A table of per-area data to join against boundaries. The CSV file csvName
+# is read straight out of the .zip at url. keyColumn holds the area code, and
+# derive takes a CSV row and returns a dictionary of properties to attach.
+CensusTable = namedtuple("CensusTable", ["url", "csvName", "keyColumn", "derive"])
+
+
 # You have to manually download the GeoJSON file from https://geoportal.statistics.gov.uk/datasets/ons::output-areas-2021-boundaries-ew-bgc/explore and pass in the path here (until we can automate this)
 def makeCensusOutputAreas(raw_boundaries_path):
-    tmp = "tmp_census_output_areas"
-    ensureEmptyTempDirectoryExists(tmp)
-
-    # Build up a dictionary from OA code to properties we want
-    oa_to_data = {}
-
-    # Grab car availability data
-    run(
-        [
-            "wget",
-            "https://www.nomisweb.co.uk/output/census/2021/census2021-ts045.zip",
-            "-O",
-            f"{tmp}/census2021-ts045.zip",
-        ]
+    tmp = ensureEmptyTempDirectoryExists(
+        "tmp_census_output_areas", estimatedBytes=2 * GB
     )
-    # Only get one file from the .zip
-    run(["unzip", f"{tmp}/census2021-ts045.zip", "census2021-ts045-oa.csv", "-d", tmp])
-    with open(f"{tmp}/census2021-ts045-oa.csv") as f:
-        for row in csv.DictReader(f):
-            oa_to_data[row["geography code"]] = summarizeCarAvailability(row)
-
-    # Grab population density
-    run(
-        [
-            "wget",
-            "https://www.nomisweb.co.uk/output/census/2021/census2021-ts006.zip",
-            "-O",
-            f"{tmp}/census2021-ts006.zip",
-        ]
-    )
-    run(["unzip", f"{tmp}/census2021-ts006.zip", "census2021-ts006-oa.csv", "-d", tmp])
-    with open(f"{tmp}/census2021-ts006-oa.csv") as f:
-        for row in csv.DictReader(f):
-            key = row["geography code"]
-            # The set of OAs in both datasets match. Let a KeyError happen if not.
-            oa_to_data[key]["population_density"] = round(
-                float(
-                    row[
-                        "Population Density: Persons per square kilometre; measures: Value"
-                    ]
-                )
-            )
 
     path = f"{tmp}/census_output_areas.geojson"
-    reprojectToWgs84(raw_boundaries_path, path)
+    reprojectToWgs84(
+        raw_boundaries_path,
+        path,
+        columns=["OA21CD"],
+        clipToEngland=True,
+        precision=6,
+    )
+
+    # Every table is attached in one pass over the geometry
+    cleanUpGeojson(
+        path,
+        joinCensusTables(tmp, outputAreaTables, "OA21CD"),
+        trimCoordinates=False,
+    )
+
+    convertGeoJsonToPmtiles(path, "output/census_output_areas.pmtiles")
+
+
+# Downloads and reads all of the tables, then returns a function to use with
+# cleanUpGeojson. It takes the area code from the keyProperty of each feature,
+# and keeps only that plus the derived properties from every table.
+def joinCensusTables(tmp, tables, keyProperty):
+    zipPaths = []
+    for table in tables:
+        zipPath = f"{tmp}/{os.path.basename(table.csvName)}.zip"
+        run(["wget", table.url, "-O", zipPath])
+        zipPaths.append(zipPath)
+    index, columns = readCensusTables(zipPaths, tables)
+    names = list(columns.keys())
 
     def fixProps(inputProps):
-        outputProps = {}
-        key = inputProps["OA21CD"]
-        outputProps.update(oa_to_data[key])
-        outputProps["OA21CD"] = key
+        key = inputProps[keyProperty]
+        # Let a KeyError happen if the boundaries have an area not in the data
+        row = index[key]
+        outputProps = {name: columns[name][row] for name in names}
+        outputProps[keyProperty] = key
         return outputProps
 
-    cleanUpGeojson(path, fixProps)
-
-    convertGeoJsonToPmtiles(path, "output/census_output_areas.pmtiles")
+    return fixProps
+
+
+# Reads each table from the .zip at the same position in zipPaths. Returns a
+# dictionary from area code to row number, and one from property name to a list
+# of values by row. Every table must cover exactly the same areas, so no
+# property is ever silently missing.
+def readCensusTables(zipPaths, tables):
+    index = {}
+    columns = {}
+    firstKeys = None
+    for zipPath, table in zip(zipPaths, tables):
+        keys = readCensusTable(zipPath, table, index, columns)
+        if firstKeys is None:
+            firstKeys = keys
+            continue
+        if keys != firstKeys:
+            extra = sorted(keys - firstKeys)
+            missing = sorted(firstKeys - keys)
+            raise Exception(
+                f"{table.csvName} doesn't cover the same areas as {tables[0].csvName}: {len(extra)} extra (like {extra[:3]}), {len(missing)} missing (like {missing[:3]})"
+            )
+    return index, columns
+
+
+# Streams one CSV out of a .zip, without unzipping it to disk, and appends the
+# derived properties to columns. Returns the set of area codes in the table.
+def readCensusTable(zipPath, table, index, columns):
+    print(f"Reading {table.csvName} from {zipPath}")
+    keys = set()
+    newColumns = defaultdict(lambda: [None] * len(index))
+    with zipfile.ZipFile(zipPath) as archive:
+        with archive.open(table.csvName) as f:
+            for row in csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig")):
+                key = row[table.keyColumn]
+                keys.add(key)
+                if key not in index:
+                    index[key] = len(index)
+                    for values in columns.values():
+                        values.append(None)
+                    for values in newColumns.values():
+                        values.append(None)
+                position = index[key]
+                for name, value in table.derive(row).items():
+                    newColumns[name][position] = value
+    columns.update(newColumns)
+    return keys
 
 
 def summarizeCarAvailability(row):
@@ -82,6 +127,35 @@ def summarizeCarAvailability(row):
     }
 
 
+def summarizePopulationDensity(row):
+    return {
+        "population_density": round(
+            float(
+                row["Population Density: Persons per square kilometre; measures: Value"]
+            )
+        )
+    }
+
+
+# To add another census variable for output areas, add a table here
+outputAreaTables = [
+    # Car availability
+    CensusTable(
+        "https://www.nomisweb.co.uk/output/census/2021/census2021-ts045.zip",
+        "census2021-ts045-oa.csv",
+        "geography code",
+        summarizeCarAvailability,
+    ),
+    # Population density
+    CensusTable(
+        "https://www.nomisweb.co.uk/output/census/2021/census2021-ts006.zip",
+        "census2021-ts006-oa.csv",
+        "geography code",
+        summarizePopulationDensity,
+    ),
+]
+
+
 # You have to manually download the GeoJSON file from https://communitiesopendata-communities.hub.arcgis.com/datasets/d473e9ad137240b6aa47c9e3f4bdd674_0/explore?location=52.724275%2C-2.327771%2C6.97 and pass in the path here (until we can automate this)
 def makeIMD(path):
     def fixProps(inputProps):
@@ -102,35 +176,22 @@ def makeIMD(path):
 
 # You have to manually download the GeoJSON file from https://geoportal.statistics.gov.uk/datasets/8df53342abe043ab89534214206617ae_0/explore ("Output Areas (December 2011) Boundaries EW BGC (V2)") and pass in the path here (until we can automate this)
 def makeRUC(path):
-    tmp = "tmp_ruc"
-    ensureEmptyTempDirectoryExists(tmp)
-
-    # From https://www.arcgis.com/sharing/rest/content/items/9f3ab554c6ad46dabe38ef0134b238fb/data, "Rural Urban Classification (2011) of Output Areas in EW"
-    run(
-        [
-            "wget",
-            "https://www.arcgis.com/sharing/rest/content/items/53360acabd1e4567bc4b8d35081b36ff/data",
-            "-O",
-            f"{tmp}/ruc.zip",
-        ]
-    )
-    run(["unzip", f"{tmp}/ruc.zip", "-d", tmp])
-
-    lookup = {}
-    with open(f"{tmp}/RUC11_OA11_EW.csv") as f:
-        for row in csv.DictReader(f):
-            lookup[row["OA11CD"]] = row["RUC11"]
-
-    def fixProps(inputProps):
-        key = inputProps["OA11CD"]
-        return {
-            "OA11CD": key,
-            "RUC11": lookup[key],
-        }
+    tmp = ensureEmptyTempDirectoryExists("tmp_ruc")
 
     # Don't overwrite the raw input; make a copy
     gj = f"{tmp}/rural_urban_classification.geojson"
     run(["cp", path, gj])
-    cleanUpGeojson(gj, fixProps)
+    cleanUpGeojson(gj, joinCensusTables(tmp, rucTables, "OA11CD"))
 
     convertGeoJsonToPmtiles(gj, "output/rural_urban_classification.pmtiles")
+
+
+rucTables = [
+    # From https://www.arcgis.com/sharing/rest/content/items/9f3ab554c6ad46dabe38ef0134b238fb/data, "Rural Urban Classification (2011) of Output Areas in EW"
+    CensusTable(
+        "https://www.arcgis.com/sharing/rest/content/items/53360acabd1e4567bc4b8d35081b36ff/data",
+        "RUC11_OA11_EW.csv",
+        "OA11CD",
+        lambda row: {"RUC11": row["RUC11"]},
+    ),
+]
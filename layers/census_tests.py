@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from census import CensusTable, readCensusTables
+
+
+def writeZip(path, csvName, rows):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(csvName, "".join(f"{row}\n" for row in rows))
+
+
+class TestReadCensusTables(unittest.TestCase):
+    def read(self, firstRows, secondRows):
+        tables = [
+            CensusTable("", "first.csv", "code", lambda row: {"a": int(row["value"])}),
+            CensusTable("", "second.csv", "code", lambda row: {"b": int(row["value"])}),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            zipPaths = [os.path.join(tmp, "first.zip"), os.path.join(tmp, "second.zip")]
+            writeZip(zipPaths[0], "first.csv", ["code,value"] + firstRows)
+            writeZip(zipPaths[1], "second.csv", ["code,value"] + secondRows)
+            return readCensusTables(zipPaths, tables)
+
+    def test_join(self):
+        # Rows can be in a different order
+        index, columns = self.read(["E1,10", "E2,20"], ["E2,2", "E1,1"])
+        self.assertEqual(
+            {key: (columns["a"][row], columns["b"][row]) for key, row in index.items()},
+            {"E1": (10, 1), "E2": (20, 2)},
+        )
+
+    def test_mismatched_areas(self):
+        # An area only in the later table
+        with self.assertRaises(Exception):
+            self.read(["E1,10"], ["E1,1", "E2,2"])
+        # An area missing from the later table
+        with self.assertRaises(Exception):
+            self.read(["E1,10", "E2,20"], ["E1,1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
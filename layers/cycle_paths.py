@@ -1,20 +1,23 @@
 from utils import *
+import line_merge
 
+# Every cycle path is a way with a highway tag, but getProps narrows this down
+tagFilter = "w/highway"
 
-def makeCyclePaths(osm_input):
+
+def makeCyclePaths(osm_input, mergeLines=False):
     if not osm_input:
         raise Exception("You must specify --osm_input")
 
     filename = "cycle_paths"
-    tmp = f"tmp_{filename}"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists(f"tmp_{filename}", estimatedBytes=10 * GB)
 
     run(
         [
             "osmium",
             "tags-filter",
             osm_input,
-            "w/highway",
+            tagFilter,
             "-o",
             f"{tmp}/cycle_paths.osm.pbf",
         ]
@@ -27,6 +30,8 @@ def makeCyclePaths(osm_input):
     cleanUpGeojson(
         gjPath, getProps, filterFeatures=lambda f: getProps(f["properties"]) != None
     )
+    if mergeLines:
+        line_merge.mergeTouchingLines(gjPath, idProperty="osm_id")
 
     convertGeoJsonToPmtiles(f"{tmp}/cycle_paths.geojson", "output/cycle_paths.pmtiles")
 
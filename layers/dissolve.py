@@ -0,0 +1,193 @@
+import json
+import math
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import *
+from spatial_index import PreparedPolygon
+
+
+# Modifies a GeoJSON file of polygons in-place, merging adjacent polygons with
+# the same value of groupProperty, and dropping every other property. Polygons
+# are adjacent if they share edges with exactly the same vertices, which is
+# the case for polygons traced from a raster, like road noise.
+#
+# England is split into a grid of cellSize degrees, and each cell is dissolved
+# in parallel. A polygon belongs to the cell containing the middle of its
+# bounding box, and isn't cut at cell boundaries, so polygons are never merged
+# across cells.
+def dissolvePolygons(path, groupProperty, cellSize=0.5):
+    print(f"Dissolving {path} by {groupProperty}")
+    tmp = f"{path}.cells"
+    os.makedirs(tmp, exist_ok=True)
+
+    # Split the input into one GeoJSONSeq file per cell
+    cells = {}
+    numInput = 0
+    for feature in readFeatures(path):
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            raise Exception(f"Can't dissolve {geometry['type']}")
+        group = feature["properties"][groupProperty]
+
+        for polygon in polygons:
+            xs = [pt[0] for pt in polygon[0]]
+            ys = [pt[1] for pt in polygon[0]]
+            cell = (
+                math.floor((min(xs) + max(xs)) / 2 / cellSize),
+                math.floor((min(ys) + max(ys)) / 2 / cellSize),
+            )
+            if cell not in cells:
+                cells[cell] = open(f"{tmp}/{cell[0]}_{cell[1]}.geojsonl", "w")
+            cells[cell].write(json.dumps([group, polygon]))
+            cells[cell].write("\n")
+            numInput += 1
+    for f in cells.values():
+        f.close()
+
+    # Sort, so the output is the same every time
+    cellPaths = [f"{tmp}/{x}_{y}.geojsonl" for x, y in sorted(cells)]
+    with ProcessPoolExecutor() as pool:
+        for _ in pool.map(dissolveCell, cellPaths):
+            pass
+
+    numOutput = 0
+
+    def features():
+        nonlocal numOutput
+        for cellPath in cellPaths:
+            with open(cellPath) as f:
+                for line in f:
+                    group, polygon = json.loads(line)
+                    numOutput += 1
+                    yield {
+                        "type": "Feature",
+                        "id": numOutput,
+                        "properties": {groupProperty: group},
+                        "geometry": {"type": "Polygon", "coordinates": polygon},
+                    }
+            os.remove(cellPath)
+
+    writeFeatureCollection(path, features())
+    os.rmdir(tmp)
+    print(f"Dissolved {numInput} polygons into {numOutput}")
+
+
+# Replaces a file of [group, polygon coordinates] lines with the dissolved
+# polygons
+def dissolveCell(cellPath):
+    polygonsPerGroup = defaultdict(list)
+    with open(cellPath) as f:
+        for line in f:
+            group, polygon = json.loads(line)
+            polygonsPerGroup[group].append(polygon)
+
+    # Groups might not be comparable, so keep the order they first appear in
+    with open(cellPath, "w") as f:
+        for group, polygons in polygonsPerGroup.items():
+            for polygon in dissolve(polygons):
+                f.write(json.dumps([group, polygon]))
+                f.write("\n")
+
+
+# Takes a list of GeoJSON Polygon coordinates and returns the union, as a list
+# of Polygon coordinates. Edges shared by two polygons cancel out, and the
+# remaining edges are traced back into rings.
+def dissolve(polygons):
+    # Orient every outer ring counter-clockwise and hole clockwise, so the
+    # polygon's interior is always on the left. A shared edge then appears once
+    # in each direction.
+    edges = {}
+    for polygon in polygons:
+        for ringIdx, ring in enumerate(polygon):
+            points = [(pt[0], pt[1]) for pt in ring]
+            if (signedArea(points) > 0) != (ringIdx == 0):
+                points.reverse()
+            for a, b in zip(points, points[1:]):
+                if a == b:
+                    continue
+                if (b, a) in edges:
+                    del edges[(b, a)]
+                else:
+                    edges[(a, b)] = True
+
+    outgoing = defaultdict(list)
+    for a, b in edges:
+        outgoing[a].append(b)
+
+    # Trace rings, turning as far left as possible where a vertex has multiple
+    # outgoing edges. This keeps polygons touching at a single point separate.
+    outers = []
+    holes = []
+    for start, firstNext in edges:
+        if firstNext not in outgoing[start]:
+            continue
+        outgoing[start].remove(firstNext)
+        ring = [start, firstNext]
+        while ring[-1] != start:
+            previous, current = ring[-2], ring[-1]
+            candidates = outgoing[current]
+            if not candidates:
+                # A broken ring, from invalid input
+                ring = None
+                break
+            nextPoint = max(candidates, key=lambda pt: turn(previous, current, pt))
+            candidates.remove(nextPoint)
+            ring.append(nextPoint)
+        if ring is None or len(ring) < 4:
+            continue
+        if signedArea(ring) > 0:
+            outers.append(ring)
+        else:
+            holes.append(ring)
+
+    # Put each hole in the smallest outer ring containing it
+    prepared = [PreparedPolygon([ring]) for ring in outers]
+    areas = [signedArea(ring) for ring in outers]
+    bboxes = [
+        (
+            min(pt[0] for pt in ring),
+            min(pt[1] for pt in ring),
+            max(pt[0] for pt in ring),
+            max(pt[1] for pt in ring),
+        )
+        for ring in outers
+    ]
+    holesPerOuter = defaultdict(list)
+    for hole in holes:
+        x, y = hole[0]
+        containing = [
+            idx
+            for idx, bbox in enumerate(bboxes)
+            if bbox[0] <= x <= bbox[2]
+            and bbox[1] <= y <= bbox[3]
+            and prepared[idx].contains(x, y)
+        ]
+        if containing:
+            holesPerOuter[min(containing, key=lambda idx: areas[idx])].append(hole)
+
+    return [
+        [[list(pt) for pt in ring] for ring in [outer] + holesPerOuter[idx]]
+        for idx, outer in enumerate(outers)
+    ]
+
+
+# Positive for counter-clockwise rings
+def signedArea(ring):
+    area = 0.0
+    for a, b in zip(ring, ring[1:]):
+        area += a[0] * b[1] - b[0] * a[1]
+    return area / 2
+
+
+# The angle turned going from a through b to c, from -pi to pi. Positive is a
+# left turn.
+def turn(a, b, c):
+    dx1, dy1 = b[0] - a[0], b[1] - a[1]
+    dx2, dy2 = c[0] - b[0], c[1] - b[1]
+    return math.atan2(dx1 * dy2 - dy1 * dx2, dx1 * dx2 + dy1 * dy2)
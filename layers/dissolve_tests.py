@@ -0,0 +1,51 @@
+import unittest
+
+from dissolve import dissolve, signedArea
+
+
+def square(x1, y1, x2, y2):
+    return [[x1, y1], [x2, y1], [x2, y2], [x1, y2], [x1, y1]]
+
+
+def normalize(polygons):
+    # Rings can start anywhere, so compare areas and vertex sets
+    return sorted(
+        [(round(signedArea(ring), 6), sorted(map(tuple, ring))) for ring in polygon]
+        for polygon in polygons
+    )
+
+
+class TestDissolve(unittest.TestCase):
+    def test_adjacent(self):
+        # Two squares sharing an edge, one drawn clockwise
+        result = dissolve([[square(0, 0, 1, 1)], [square(1, 0, 2, 1)[::-1]]])
+        self.assertEqual(
+            normalize(result),
+            normalize([[[[0, 0], [1, 0], [2, 0], [2, 1], [1, 1], [0, 1], [0, 0]]]]),
+        )
+
+    def test_ring_makes_a_hole(self):
+        # Eight squares surrounding an empty middle square
+        result = dissolve(
+            [
+                [square(x, y, x + 1, y + 1)]
+                for x in range(3)
+                for y in range(3)
+                if (x, y) != (1, 1)
+            ]
+        )
+        self.assertEqual(len(result), 1)
+        outer, hole = result[0]
+        self.assertEqual(signedArea(outer), 9)
+        self.assertEqual(signedArea(hole), -1)
+
+    def test_touching_corners_stay_separate(self):
+        result = dissolve([[square(0, 0, 1, 1)], [square(1, 1, 2, 2)]])
+        self.assertEqual(
+            normalize(result),
+            normalize([[square(0, 0, 1, 1)], [square(1, 1, 2, 2)]]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
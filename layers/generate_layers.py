@@ -3,10 +3,14 @@
 import argparse
 
 from utils import *
+import authority_bundles
+import authority_stats
 import census
 import boundaries
 import cycle_paths
+import line_merge
 import osm
+import osm_changes
 import pct
 import rights_of_way
 import road_noise
@@ -22,6 +26,9 @@ def main():
     parser.add_argument("--mrn", action="store_true")
     parser.add_argument("--srn", action="store_true")
     parser.add_argument("--parliamentary_constituencies", action="store_true")
+    parser.add_argument("--district_borough_unitary", action="store_true")
+    parser.add_argument("--district_borough_unitary_ward", action="store_true")
+    parser.add_argument("--unitary_electoral_division", action="store_true")
     parser.add_argument("--railway_stations", action="store_true")
     parser.add_argument("--trams", action="store_true")
     parser.add_argument("--sports_spaces", action="store_true")
@@ -31,6 +38,17 @@ def main():
     parser.add_argument("--local_authorities_for_sketcher", action="store_true")
     parser.add_argument("--transport_authorities_for_sketcher", action="store_true")
     parser.add_argument("--local_planning_authorities", action="store_true")
+    parser.add_argument(
+        "--authorities",
+        action="store_true",
+        help="Build authorities.geojson from the manually downloaded LAD and TA inputs",
+    )
+    parser.add_argument(
+        "--authorities_retain",
+        default=0.015,
+        help="For --authorities, the fraction of removable boundary vertices to keep",
+        type=float,
+    )
     parser.add_argument(
         "--census_output_areas",
         help="Path to the manually downloaded Output_Areas_2021_EW_BGC_V2_-3080813486471056666.geojson",
@@ -46,7 +64,17 @@ def main():
     parser.add_argument("--cycle_paths", action="store_true")
     parser.add_argument("--ncn", action="store_true")
     parser.add_argument("--vehicle_counts", action="store_true")
+    parser.add_argument(
+        "--vehicle_count_history",
+        action="store_true",
+        help="For --vehicle_counts, also include the counts from every year",
+    )
     parser.add_argument("--pct", action="store_true")
+    parser.add_argument(
+        "--combine_pct",
+        action="store_true",
+        help="For --pct, output one pct.pmtiles with both commute and school properties, instead of two files",
+    )
     parser.add_argument("--road_noise", action="store_true")
     parser.add_argument("--rights_of_way", action="store_true")
     parser.add_argument(
@@ -54,128 +82,303 @@ def main():
         help="Path to the manually downloaded Output_Areas_Dec_2011_Boundaries_EW_BGC_2022_7812884375712211689.geojson",
         type=str,
     )
+    parser.add_argument(
+        "--sociodemographic",
+        help="Path to a working directory with the manually downloaded inputs for the sociodemographic layers (see sociodemographic.py). Outputs go in its outputs/ directory.",
+        type=str,
+    )
     # Inputs required for some outputs
     parser.add_argument(
         "-i", "--osm_input", help="Path to england-latest.osm.pbf file", type=str
     )
+    parser.add_argument(
+        "--osm_changes",
+        help="Paths to OSM change files (.osc or .osc.gz) to apply to --osm_input. The OSM layers affected by the changes are regenerated.",
+        nargs="+",
+        type=str,
+    )
+    # Scratch space and outputs
+    parser.add_argument(
+        "--tmp_root",
+        default=".",
+        help="Directory to create each layer's temporary files in. A fast local disk helps.",
+        type=str,
+    )
+    parser.add_argument(
+        "--keep_tmp",
+        "--keep-tmp",
+        action="store_true",
+        help="Don't delete each layer's temporary files after it's done",
+    )
+    parser.add_argument(
+        "--tag_authorities",
+        action="store_true",
+        help="Add the LAD and TA names that features are in to --education, --cycle_parking, --railway_stations, and --vehicle_counts",
+    )
+    parser.add_argument(
+        "--point_layers",
+        action="store_true",
+        help="For --education, --hospitals, and --sports_spaces, also make a {layer}_points.pmtiles for low zooms",
+    )
+    parser.add_argument(
+        "--merge_lines",
+        action="store_true",
+        help="Join touching lines with the same properties in --cycle_paths, --bus_routes, --trams, --rights_of_way, and --ncn, to make fewer features",
+    )
+    parser.add_argument(
+        "--authority_stats",
+        action="store_true",
+        help="Summarize the layers being built per authority in output/authority_stats.json",
+    )
+    parser.add_argument(
+        "--authority_bundles",
+        action="store_true",
+        help="Also clip small point and line layers to each authority, in output/areas/",
+    )
+    parser.add_argument(
+        "--topojson",
+        action="store_true",
+        help="Also write the small GeoJSON outputs (--combined_authorities, --local_authority_districts, --authorities, --railway_stations) as TopoJSON",
+    )
+    parser.add_argument(
+        "--flatgeobuf",
+        action="store_true",
+        help="Also write every layer being built as output/{layer}.fgb, for bounding box queries",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Also write a gzipped copy of every GeoJSON, JSON, and TopoJSON output",
+    )
+    parser.add_argument(
+        "--brotli",
+        action="store_true",
+        help="With --compress, also write brotli copies. Needs the brotli command.",
+    )
+    parser.add_argument(
+        "--previous_manifest",
+        help="Path to the manifest.json of the last upload, to compare outputs against. By default, output/uploaded_manifest.json is used. If it doesn't exist, every output is listed as changed.",
+        type=str,
+    )
     args = parser.parse_args()
 
-    made_any = False
+    scratch.configure(args.tmp_root, args.keep_tmp)
     os.makedirs("output", exist_ok=True)
+    built = []
+    stats = None
+    if args.authority_stats:
+        stats = authority_stats.AuthorityStats("output/authority_stats.json")
+
+    # Make one layer, run optional stages over its output, then free its
+    # scratch space
+    def build(layerName, makeLayer, *layerArgs):
+        built.append(layerName)
+        makeLayer(*layerArgs)
+        for outputLayer, geojsonPath in scratch.cleanedLayers.items():
+            if stats:
+                stats.summarizeLayer(outputLayer, geojsonPath)
+            if args.authority_bundles:
+                authority_bundles.makeBundles(outputLayer, geojsonPath)
+            if args.flatgeobuf:
+                convertGeoJsonToFlatGeobuf(
+                    geojsonPath, f"output/{outputLayer}.fgb", outputLayer
+                )
+        scratch.finishLayer(layerName)
+
+    if args.osm_changes:
+        for layer in osm_changes.applyChanges(args.osm_input, args.osm_changes):
+            setattr(args, layer, True)
+        scratch.finishLayer("osm_changes")
 
     if args.education:
-        made_any = True
-        osm.makeEducationLayer(args.osm_input)
+        build(
+            "education",
+            osm.makeEducationLayer,
+            args.osm_input,
+            args.tag_authorities,
+            args.point_layers,
+        )
 
     if args.hospitals:
-        made_any = True
-        # Note https://wiki.openstreetmap.org/wiki/Tag:amenity%3Dhospital doesn't
-        # cover all types of medical facility
-        osm.generatePolygonLayer(args.osm_input, "amenity=hospital", "hospitals")
+        build(
+            "hospitals",
+            osm.generatePolygonLayer,
+            args.osm_input,
+            osm.tagFilters["hospitals"],
+            "hospitals",
+            args.point_layers,
+        )
 
     if args.mrn:
-        made_any = True
-        makeMRN()
+        build("mrn", makeMRN)
 
     if args.srn:
-        made_any = True
-        srn.makeSRN()
+        build("srn", srn.makeSRN)
 
-    if args.parliamentary_constituencies:
-        made_any = True
-        boundaries.makeParliamentaryConstituencies()
+    # All of these come from one download of OS BoundaryLine
+    boundaryLineLayers = [
+        output for output in boundaries.boundaryLineLayers if getattr(args, output)
+    ]
+    if boundaryLineLayers:
+        build("boundary_line", boundaries.makeBoundaryLineLayers, boundaryLineLayers)
 
     if args.wards:
-        made_any = True
-        boundaries.makeWards()
+        build("wards", boundaries.makeWards)
 
     if args.combined_authorities:
-        made_any = True
-        boundaries.makeCombinedAuthorities()
+        build("combined_authorities", boundaries.makeCombinedAuthorities, args.topojson)
 
     if args.local_authority_districts:
-        made_any = True
-        boundaries.makeLocalAuthorityDistricts()
+        build(
+            "local_authority_districts",
+            boundaries.makeLocalAuthorityDistricts,
+            args.topojson,
+        )
 
     if args.local_authorities_for_sketcher:
-        made_any = True
-        boundaries.makeLocalAuthorityDistrictsForSketcher()
+        build(
+            "local_authorities_for_sketcher",
+            boundaries.makeLocalAuthorityDistrictsForSketcher,
+        )
 
     if args.transport_authorities_for_sketcher:
-        made_any = True
-        boundaries.makeTransportAuthoritiesForSketcher()
+        build(
+            "transport_authorities_for_sketcher",
+            boundaries.makeTransportAuthoritiesForSketcher,
+        )
+
+    if args.authorities:
+        build(
+            "authorities",
+            boundaries.makeAuthorities,
+            args.authorities_retain,
+            args.topojson,
+        )
 
     if args.local_planning_authorities:
-        made_any = True
-        boundaries.makeLocalPlanningAuthorities()
+        build("local_planning_authorities", boundaries.makeLocalPlanningAuthorities)
 
     if args.census_output_areas:
-        made_any = True
-        census.makeCensusOutputAreas(args.census_output_areas)
+        build(
+            "census_output_areas",
+            census.makeCensusOutputAreas,
+            args.census_output_areas,
+        )
 
     if args.railway_stations:
-        made_any = True
-        osm.makeRailwayStations(args.osm_input)
+        build(
+            "railway_stations",
+            osm.makeRailwayStations,
+            args.osm_input,
+            args.tag_authorities,
+            args.topojson,
+        )
 
     if args.sports_spaces:
-        made_any = True
-        osm.generatePolygonLayer(
-            args.osm_input, "leisure=pitch,sports_centre", "sports_spaces"
+        build(
+            "sports_spaces",
+            osm.generatePolygonLayer,
+            args.osm_input,
+            osm.tagFilters["sports_spaces"],
+            "sports_spaces",
+            args.point_layers,
         )
 
     if args.bus_routes:
-        made_any = True
-        osm.makeBusRoutes(args.osm_input)
+        build("bus_routes", osm.makeBusRoutes, args.osm_input, args.merge_lines)
 
     if args.cycle_parking:
-        made_any = True
-        osm.makeCycleParking(args.osm_input)
+        build(
+            "cycle_parking",
+            osm.makeCycleParking,
+            args.osm_input,
+            args.tag_authorities,
+        )
 
     if args.trams:
-        made_any = True
-        osm.makeTrams(args.osm_input)
+        build("trams", osm.makeTrams, args.osm_input, args.merge_lines)
 
     if args.imd:
-        made_any = True
-        census.makeIMD(args.imd)
+        build("imd", census.makeIMD, args.imd)
 
     if args.cycle_paths:
-        made_any = True
-        cycle_paths.makeCyclePaths(args.osm_input)
+        build(
+            "cycle_paths",
+            cycle_paths.makeCyclePaths,
+            args.osm_input,
+            args.merge_lines,
+        )
 
     if args.ncn:
-        made_any = True
-        makeNationalCycleNetwork()
+        build("ncn", makeNationalCycleNetwork, args.merge_lines)
 
     if args.vehicle_counts:
-        made_any = True
-        vehicle_counts.makeDftVehicleCounts()
+        build(
+            "vehicle_counts",
+            vehicle_counts.makeDftVehicleCounts,
+            args.tag_authorities,
+            args.vehicle_count_history,
+        )
 
     if args.pct:
-        made_any = True
-        pct.makePct()
+        build("pct", pct.makePct, args.combine_pct)
 
     if args.road_noise:
-        made_any = True
-        road_noise.makeRoadNoise()
+        build("road_noise", road_noise.makeRoadNoise)
 
     if args.rights_of_way:
-        made_any = True
-        rights_of_way.makeRoW()
+        build("rights_of_way", rights_of_way.makeRoW, args.merge_lines)
 
     if args.rural_urban_classification:
-        made_any = True
-        census.makeRUC(args.rural_urban_classification)
+        build(
+            "rural_urban_classification",
+            census.makeRUC,
+            args.rural_urban_classification,
+        )
+
+    if args.sociodemographic:
+        # This needs geopandas, so only import it when used
+        import sociodemographic
 
-    if not made_any:
+        build(
+            "sociodemographic",
+            sociodemographic.makeSociodemographicLayers,
+            args.sociodemographic,
+        )
+
+    if stats:
+        stats.write()
+
+    if built:
+        print("Scratch space used:")
+        scratch.printSummary()
+
+        # Bookkeeping files that aren't outputs to upload
+        notOutputs = ["output/uploaded_manifest.json", "output/changed_outputs.txt"]
+        if args.compress:
+            compressOutputs(
+                "output", "output/manifest.json", args.brotli, ignore=notOutputs
+            )
+
+        # Only these files need to be uploaded again. Compare against the last
+        # upload, not the last run, so outputs from a run that was never
+        # uploaded stay listed.
+        changed, _ = writeOutputManifest(
+            "output",
+            "output/manifest.json",
+            args.previous_manifest or "output/uploaded_manifest.json",
+            ignore=notOutputs,
+        )
+        with open("output/changed_outputs.txt", "w") as f:
+            f.write("".join(f"{name}\n" for name in changed))
+    else:
         print(
             "Didn't create anything. Call with --help to see possible layers that can be created"
         )
 
 
 def makeMRN():
-    tmp = "tmp_mrn"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists("tmp_mrn")
 
     # Get the shapefile
     run(
@@ -189,7 +392,11 @@ def makeMRN():
     run(["unzip", f"{tmp}/Major_Road_Network_2018_Open_Roads.zip", "-d", tmp])
 
     reprojectToWgs84(
-        f"{tmp}/Major_Road_Network_2018_Open_Roads.shp", f"{tmp}/mrn.geojson"
+        f"{tmp}/Major_Road_Network_2018_Open_Roads.shp",
+        f"{tmp}/mrn.geojson",
+        columns=["name1"],
+        clipToEngland=True,
+        precision=6,
     )
 
     def fixProps(inputProps):
@@ -199,14 +406,13 @@ def makeMRN():
             outputProps["name"] = name
         return outputProps
 
-    cleanUpGeojson(f"{tmp}/mrn.geojson", fixProps)
+    cleanUpGeojson(f"{tmp}/mrn.geojson", fixProps, trimCoordinates=False)
 
     convertGeoJsonToPmtiles(f"{tmp}/mrn.geojson", "output/mrn.pmtiles")
 
 
-def makeNationalCycleNetwork():
-    tmp = "tmp_ncn"
-    ensureEmptyTempDirectoryExists(tmp)
+def makeNationalCycleNetwork(mergeLines=False):
+    tmp = ensureEmptyTempDirectoryExists("tmp_ncn")
 
     # Get the geojson from the link found at https://data-sustrans-uk.opendata.arcgis.com/
     run(
@@ -232,6 +438,8 @@ def makeNationalCycleNetwork():
         return inputProps
 
     cleanUpGeojson(f"{tmp}/national_cycle_network.geojson", fixProps)
+    if mergeLines:
+        line_merge.mergeTouchingLines(f"{tmp}/national_cycle_network.geojson")
 
     convertGeoJsonToPmtiles(
         f"{tmp}/national_cycle_network.geojson", "output/national_cycle_network.pmtiles"
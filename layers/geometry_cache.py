@@ -0,0 +1,74 @@
+import glob
+import json
+import os
+
+from utils import hashFile
+
+
+# Reads a boundary file (GeoJSON or anything else GDAL understands) into a
+# GeoDataFrame. Parsing a big GeoJSON file takes minutes, so the first read
+# converts it to GeoParquet in cacheDirectory, keyed by the SHA-256 of the
+# source file. Later reads of the same file come from the cache and only load
+# the requested columns, plus geometry. If the source file changes, the old
+# cached copy is replaced. The hash is only recomputed when the source file's
+# size or modification time changes.
+def readGeometry(path, columns=None, cacheDirectory="geometry_cache"):
+    # geopandas is only needed by the sociodemographic layers, so don't require
+    # it to import this module
+    import geopandas as gpd
+
+    cachePath = cacheGeometry(path, cacheDirectory)
+    if columns is not None:
+        columns = list(columns) + ["geometry"]
+    return gpd.read_parquet(cachePath, columns=columns)
+
+
+# Makes sure the GeoParquet copy of path exists, and returns its path. Call
+# this before reading the same file from multiple processes, so only one of
+# them converts it.
+def cacheGeometry(path, cacheDirectory="geometry_cache"):
+    import geopandas as gpd
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(cacheDirectory, exist_ok=True)
+    cachePath = (
+        f"{cacheDirectory}/{name}-{sourceHash(path, cacheDirectory)[:16]}.parquet"
+    )
+    if os.path.exists(cachePath):
+        return cachePath
+
+    print(f"Caching {path} as {cachePath}")
+    for stale in glob.glob(f"{cacheDirectory}/{glob.escape(name)}-*.parquet"):
+        os.remove(stale)
+    # Write somewhere else first, so an interrupted run doesn't leave a partial
+    # file that looks valid
+    partialPath = f"{cachePath}.{os.getpid()}.partial"
+    gpd.read_file(path).to_parquet(partialPath)
+    os.replace(partialPath, cachePath)
+    return cachePath
+
+
+# Returns the SHA-256 of a file. Hashing a big file takes a while, so the hash
+# is stored next to the cache with the file's size and modification time, and
+# reused while those are unchanged.
+def sourceHash(path, cacheDirectory):
+    name = os.path.splitext(os.path.basename(path))[0]
+    hashPath = f"{cacheDirectory}/{name}.source.json"
+    stat = os.stat(path)
+    source = {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if os.path.exists(hashPath):
+        with open(hashPath) as f:
+            stored = json.load(f)
+        if stored["source"] == source:
+            return stored["sha256"]
+
+    sha256 = hashFile(path)
+    partialPath = f"{hashPath}.{os.getpid()}.partial"
+    with open(partialPath, "w") as f:
+        json.dump({"source": source, "sha256": sha256}, f)
+    os.replace(partialPath, hashPath)
+    return sha256
@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import geometry_cache
+from geometry_cache import cacheGeometry, readGeometry
+from utils import writeFeatureCollection
+
+
+def writeAreas(path, value):
+    writeFeatureCollection(
+        path,
+        [
+            {
+                "type": "Feature",
+                "properties": {"code": f"E{i}", "value": value},
+                "geometry": {"type": "Point", "coordinates": [i, 0]},
+            }
+            for i in range(3)
+        ],
+    )
+
+
+@unittest.skipUnless(importlib.util.find_spec("geopandas"), "needs geopandas")
+class TestGeometryCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "areas.geojson")
+        self.cacheDirectory = os.path.join(self.tmp.name, "cache")
+        writeAreas(self.path, 1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cache_hit(self):
+        first = cacheGeometry(self.path, self.cacheDirectory)
+        # Neither the source file nor its hash is read again
+        with unittest.mock.patch.object(
+            geometry_cache, "hashFile", side_effect=AssertionError
+        ), unittest.mock.patch("geopandas.read_file", side_effect=AssertionError):
+            self.assertEqual(cacheGeometry(self.path, self.cacheDirectory), first)
+            gdf = readGeometry(self.path, cacheDirectory=self.cacheDirectory)
+        self.assertEqual(list(gdf["code"]), ["E0", "E1", "E2"])
+
+    def test_invalidation(self):
+        first = cacheGeometry(self.path, self.cacheDirectory)
+        writeAreas(self.path, 2)
+        # Make sure the modification time changes on coarse filesystems
+        os.utime(self.path, ns=(0, os.stat(first).st_mtime_ns + 10**9))
+        second = cacheGeometry(self.path, self.cacheDirectory)
+        self.assertNotEqual(first, second)
+        self.assertFalse(os.path.exists(first))
+        gdf = readGeometry(self.path, cacheDirectory=self.cacheDirectory)
+        self.assertEqual(list(gdf["value"]), [2, 2, 2])
+
+    def test_columns(self):
+        gdf = readGeometry(self.path, ["code"], self.cacheDirectory)
+        self.assertEqual(list(gdf.columns), ["code", "geometry"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+from collections import defaultdict
+
+from utils import *
+
+
+# Modifies a GeoJSON file of lines in-place, joining LineStrings with identical
+# properties end-to-start into longer LineStrings. Lines are only joined where
+# exactly two line ends meet, so junctions with other lines are kept, and
+# they're never reversed, so one-way lines keep their direction.
+#
+# idProperty, like osm_id, is ignored when comparing properties. The merged
+# line gets all of the IDs, separated by semicolons.
+#
+# The result is written as GeoJSONSeq if the path ends in .geojsonl, or
+# otherwise in the format from writeFeatureCollection.
+def mergeTouchingLines(path, idProperty=None):
+    print(f"Merging lines in {path}")
+    # Split MultiLineStrings, and group by properties
+    lines = []
+    groups = []
+    groupKeys = {}
+    for feature in readFeatures(path):
+        props = feature["properties"]
+        key = json.dumps(
+            {k: v for k, v in props.items() if k != idProperty}, sort_keys=True
+        )
+        if key not in groupKeys:
+            groupKeys[key] = len(groupKeys)
+        group = groupKeys[key]
+        geometry = feature["geometry"]
+        if geometry["type"] == "LineString":
+            parts = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiLineString":
+            parts = geometry["coordinates"]
+        else:
+            raise Exception(f"Can't merge {geometry['type']}")
+        for coordinates in parts:
+            lines.append((coordinates, props))
+            groups.append(group)
+
+    # Index every line's endpoints
+    starts = {}
+    ends = {}
+    degree = defaultdict(int)
+    for idx, (coordinates, _) in enumerate(lines):
+        start = tuple(coordinates[0])
+        end = tuple(coordinates[-1])
+        starts[start] = idx
+        ends[end] = idx
+        degree[start] += 1
+        degree[end] += 1
+
+    # The line continuing idx, or None
+    def nextLine(idx):
+        end = tuple(lines[idx][0][-1])
+        if degree[end] == 2 and end in starts:
+            other = starts[end]
+            if other != idx and groups[other] == groups[idx]:
+                return other
+        return None
+
+    # The line idx continues, or None
+    def previousLine(idx):
+        start = tuple(lines[idx][0][0])
+        if degree[start] == 2 and start in ends:
+            other = ends[start]
+            if other != idx and groups[other] == groups[idx]:
+                return other
+        return None
+
+    def merged():
+        visited = set()
+        for idx in range(len(lines)):
+            if idx in visited:
+                continue
+
+            # Find the start of the chain. A closed loop starts here.
+            first = idx
+            while True:
+                prev = previousLine(first)
+                if prev == idx:
+                    first = idx
+                    break
+                if prev is None or prev in visited:
+                    break
+                first = prev
+
+            chain = []
+            current = first
+            while current is not None and current not in visited:
+                visited.add(current)
+                chain.append(current)
+                current = nextLine(current)
+
+            coordinates = list(lines[chain[0]][0])
+            for other in chain[1:]:
+                coordinates.extend(lines[other][0][1:])
+            props = dict(lines[chain[0]][1])
+            if idProperty and idProperty in props:
+                props[idProperty] = ";".join(
+                    str(lines[other][1][idProperty]) for other in chain
+                )
+            yield {
+                "type": "Feature",
+                "properties": props,
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+            }
+
+    numFeatures = 0
+
+    def numbered():
+        nonlocal numFeatures
+        for feature in merged():
+            numFeatures += 1
+            # The frontend needs IDs for hovering
+            feature["id"] = numFeatures
+            yield feature
+
+    if path.endswith(".geojsonl"):
+        with open(path, "w") as f:
+            for feature in numbered():
+                f.write(json.dumps(feature))
+                f.write("\n")
+    else:
+        writeFeatureCollection(path, numbered())
+    print(f"Merged {len(lines)} lines into {numFeatures}")
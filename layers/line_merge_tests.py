@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from line_merge import mergeTouchingLines
+from utils import readFeatures, writeFeatureCollection
+
+
+def line(osmID, kind, *coordinates):
+    return {
+        "type": "Feature",
+        "properties": {"osm_id": osmID, "kind": kind},
+        "geometry": {"type": "LineString", "coordinates": list(coordinates)},
+    }
+
+
+class TestMergeTouchingLines(unittest.TestCase):
+    def merge(self, features):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "lines.geojson")
+            writeFeatureCollection(path, features)
+            mergeTouchingLines(path, idProperty="osm_id")
+            return [
+                (
+                    feature["properties"]["osm_id"],
+                    feature["properties"]["kind"],
+                    feature["geometry"]["coordinates"],
+                )
+                for feature in readFeatures(path)
+            ]
+
+    def test_chain(self):
+        # Out of order, but all drawn in the same direction
+        self.assertEqual(
+            self.merge(
+                [
+                    line(2, "track", [1, 0], [2, 0]),
+                    line(1, "track", [0, 0], [1, 0]),
+                    line(3, "track", [2, 0], [3, 0], [3, 1]),
+                ]
+            ),
+            [("1;2;3", "track", [[0, 0], [1, 0], [2, 0], [3, 0], [3, 1]])],
+        )
+
+    def test_keeps_junctions_and_differences(self):
+        self.assertEqual(
+            self.merge(
+                [
+                    line(1, "track", [0, 0], [1, 0]),
+                    # Different properties
+                    line(2, "lane", [1, 0], [2, 0]),
+                    # Three lines meet at [2, 0]
+                    line(3, "lane", [2, 0], [3, 0]),
+                    line(4, "lane", [2, 0], [2, 1]),
+                    # Drawn the other way
+                    line(5, "lane", [4, 0], [3, 0]),
+                ]
+            ),
+            [
+                ("1", "track", [[0, 0], [1, 0]]),
+                ("2", "lane", [[1, 0], [2, 0]]),
+                ("3", "lane", [[2, 0], [3, 0]]),
+                ("4", "lane", [[2, 0], [2, 1]]),
+                ("5", "lane", [[4, 0], [3, 0]]),
+            ],
+        )
+
+    def test_loop(self):
+        self.assertEqual(
+            self.merge(
+                [
+                    line(1, "track", [0, 0], [1, 0]),
+                    line(2, "track", [1, 0], [1, 1]),
+                    line(3, "track", [1, 1], [0, 0]),
+                ]
+            ),
+            [("1;2;3", "track", [[0, 0], [1, 0], [1, 1], [0, 0]])],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,36 @@
 from utils import *
+import line_merge
+from spatial_index import loadAuthorities
+
+# The osmium tags-filter expression used by each layer. These also decide which
+# layers an incremental update affects.
+tagFilters = {
+    "education": "nwr/amenity=school,college,university",
+    # Note https://wiki.openstreetmap.org/wiki/Tag:amenity%3Dhospital doesn't
+    # cover all types of medical facility
+    "hospitals": "nwr/amenity=hospital",
+    "sports_spaces": "nwr/leisure=pitch,sports_centre",
+    "railway_stations": "n/railway=station",
+    "bus_routes": "r/route=bus",
+    # See https://wiki.openstreetmap.org/wiki/Tag:amenity%3Dbicycle_parking
+    "cycle_parking": "n/amenity=bicycle_parking",
+    # Manchester's trams are tagged as light_rail
+    "trams": "nwr/railway=tram,light_rail",
+}
+
+
+# Below this zoom, layers made with pointLayer only have points
+polygonMinZoom = 12
 
 
 # Extract polygons from OSM using a tag filter, and only keep a name attribute.
-def generatePolygonLayer(osm_input, tagFilter, filename):
+# With pointLayer, also make {filename}_points.pmtiles with a point inside each
+# polygon, for zooms below polygonMinZoom, and only make polygons from there.
+def generatePolygonLayer(osm_input, tagFilter, filename, pointLayer=False):
     if not osm_input:
         raise Exception("You must specify --osm_input")
 
-    tmp = f"tmp_{filename}"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists(f"tmp_{filename}")
 
     # TODO Do we need nwr? We don't want points further on
     run(
@@ -15,7 +38,7 @@ def generatePolygonLayer(osm_input, tagFilter, filename):
             "osmium",
             "tags-filter",
             osm_input,
-            f"nwr/{tagFilter}",
+            tagFilter,
             "-o",
             f"{tmp}/extract.osm.pbf",
         ]
@@ -27,24 +50,42 @@ def generatePolygonLayer(osm_input, tagFilter, filename):
 
     cleanUpGeojson(f"{tmp}/{filename}.geojson", onlyKeepName)
 
-    convertGeoJsonToPmtiles(f"{tmp}/{filename}.geojson", f"output/{filename}.pmtiles")
+    convertPolygonLayer(tmp, filename, pointLayer)
+
+
+def convertPolygonLayer(tmp, filename, pointLayer):
+    if not pointLayer:
+        convertGeoJsonToPmtiles(
+            f"{tmp}/{filename}.geojson", f"output/{filename}.pmtiles"
+        )
+        return
 
+    writePointLayer(f"{tmp}/{filename}.geojson", f"{tmp}/{filename}_points.geojson")
+    convertGeoJsonToPmtiles(
+        f"{tmp}/{filename}.geojson",
+        f"output/{filename}.pmtiles",
+        args=[f"--minimum-zoom={polygonMinZoom}"],
+    )
+    convertGeoJsonToPmtiles(
+        f"{tmp}/{filename}_points.geojson",
+        f"output/{filename}_points.pmtiles",
+        args=[f"--maximum-zoom={polygonMinZoom - 1}", "--drop-densest-as-needed"],
+    )
 
-def makeEducationLayer(osm_input):
+
+def makeEducationLayer(osm_input, tagAuthorities=False, pointLayer=False):
     if not osm_input:
         raise Exception("You must specify --osm_input")
     filename = "education"
-    tagFilter = "amenity=school,college,university"
 
-    tmp = f"tmp_{filename}"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists(f"tmp_{filename}")
 
     run(
         [
             "osmium",
             "tags-filter",
             osm_input,
-            f"nwr/{tagFilter}",
+            tagFilters[filename],
             "-o",
             f"{tmp}/extract.osm.pbf",
         ]
@@ -65,9 +106,13 @@ def makeEducationLayer(osm_input):
         outputProps["type"] = type
         return outputProps
 
-    cleanUpGeojson(f"{tmp}/{filename}.geojson", cleanUpFeature)
+    cleanUpGeojson(
+        f"{tmp}/{filename}.geojson",
+        cleanUpFeature,
+        authorities=loadAuthorities() if tagAuthorities else None,
+    )
 
-    convertGeoJsonToPmtiles(f"{tmp}/{filename}.geojson", f"output/{filename}.pmtiles")
+    convertPolygonLayer(tmp, filename, pointLayer)
 
 
 def onlyKeepName(inputProps):
@@ -78,22 +123,19 @@ def onlyKeepName(inputProps):
     return outputProps
 
 
-def makeRailwayStations(
-    osm_input,
-):
+def makeRailwayStations(osm_input, tagAuthorities=False, topojson=False):
     if not osm_input:
         raise Exception("You must specify --osm_input")
 
     filename = "railway_stations"
-    tmp = f"tmp_{filename}"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists(f"tmp_{filename}")
     osmFilePath = f"{tmp}/extract.osm.pbf"
     run(
         [
             "osmium",
             "tags-filter",
             osm_input,
-            "n/railway=station",
+            tagFilters[filename],
             "-o",
             osmFilePath,
         ]
@@ -101,16 +143,22 @@ def makeRailwayStations(
     outputFilepath = f"output/{filename}.geojson"
     convertPbfToGeoJson(osmFilePath, outputFilepath, "point")
 
-    cleanUpGeojson(outputFilepath, onlyKeepName)
+    cleanUpGeojson(
+        outputFilepath,
+        onlyKeepName,
+        authorities=loadAuthorities() if tagAuthorities else None,
+    )
+    registerCleanedLayer(filename, outputFilepath)
+    if topojson:
+        writeTopoJson(outputFilepath, f"output/{filename}.topojson", filename)
 
 
-def makeBusRoutes(osm_input):
+def makeBusRoutes(osm_input, mergeLines=False):
     if not osm_input:
         raise Exception("You must specify --osm_input")
 
     filename = "bus_routes"
-    tmp = f"tmp_{filename}"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists(f"tmp_{filename}")
 
     # Bus routes are represented as relations. Note many routes cross the same
     # way, but osmium only outputs the way once when we export to GeoJSON
@@ -119,7 +167,7 @@ def makeBusRoutes(osm_input):
             "osmium",
             "tags-filter",
             osm_input,
-            "r/route=bus",
+            tagFilters[filename],
             "-o",
             f"{tmp}/extract.osm.pbf",
         ]
@@ -137,25 +185,25 @@ def makeBusRoutes(osm_input):
         return outputProps
 
     cleanUpGeojson(f"{tmp}/{filename}.geojson", fixProps)
+    if mergeLines:
+        line_merge.mergeTouchingLines(f"{tmp}/{filename}.geojson")
 
     convertGeoJsonToPmtiles(f"{tmp}/{filename}.geojson", f"output/{filename}.pmtiles")
 
 
-def makeCycleParking(osm_input):
+def makeCycleParking(osm_input, tagAuthorities=False):
     if not osm_input:
         raise Exception("You must specify --osm_input")
 
     filename = "cycle_parking"
-    tmp = f"tmp_{filename}"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists(f"tmp_{filename}")
 
-    # See https://wiki.openstreetmap.org/wiki/Tag:amenity%3Dbicycle_parking
     run(
         [
             "osmium",
             "tags-filter",
             osm_input,
-            "n/amenity=bicycle_parking",
+            tagFilters[filename],
             "-o",
             f"{tmp}/extract.osm.pbf",
         ]
@@ -171,10 +219,18 @@ def makeCycleParking(osm_input):
             pass
         return outputProps
 
-    cleanUpGeojson(f"{tmp}/{filename}.geojson", fixProps)
+    cleanUpGeojson(
+        f"{tmp}/{filename}.geojson",
+        fixProps,
+        authorities=loadAuthorities() if tagAuthorities else None,
+    )
 
+    # Keep the biggest sites at low zooms. Most don't have a capacity.
     convertGeoJsonToPmtiles(
-        f"{tmp}/{filename}.geojson", f"output/{filename}.pmtiles", autoZoom=True
+        f"{tmp}/{filename}.geojson",
+        f"output/{filename}.pmtiles",
+        autoZoom=True,
+        importance=lambda f: f["properties"].get("capacity", 0),
     )
 
 
@@ -222,21 +278,19 @@ def roadHasBusLane(tags):
     return False
 
 
-def makeTrams(osm_input):
+def makeTrams(osm_input, mergeLines=False):
     if not osm_input:
         raise Exception("You must specify --osm_input")
 
     filename = "trams"
-    tmp = f"tmp_{filename}"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists(f"tmp_{filename}")
 
     run(
         [
             "osmium",
             "tags-filter",
             osm_input,
-            # Manchester's trams are tagged as light_rail
-            "nwr/railway=tram,light_rail",
+            tagFilters[filename],
             "-o",
             f"{tmp}/extract.osm.pbf",
         ]
@@ -254,5 +308,7 @@ def makeTrams(osm_input):
         }
 
     cleanUpGeojson(f"{tmp}/{filename}.geojson", fixProps)
+    if mergeLines:
+        line_merge.mergeTouchingLines(f"{tmp}/{filename}.geojson", idProperty="osm_id")
 
     convertGeoJsonToPmtiles(f"{tmp}/{filename}.geojson", f"output/{filename}.pmtiles")
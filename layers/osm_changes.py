@@ -0,0 +1,140 @@
+import gzip
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+
+from utils import *
+import cycle_paths
+import osm
+
+
+# Applies OSM change files (.osc or .osc.gz) to osm_input in-place, and returns
+# the names of the OSM layers that need to be regenerated. Nothing is
+# downloaded; the change files must already be on disk.
+def applyChanges(osm_input, changeFiles):
+    if not osm_input:
+        raise Exception("You must specify --osm_input")
+
+    tmp = ensureEmptyTempDirectoryExists("tmp_osm_changes")
+
+    # Everything created, modified, or deleted. Deleted objects may not have
+    # tags, so we also look at the old version below.
+    changed = []
+    for path in changeFiles:
+        changed.extend(readOsmXml(path))
+
+    # The old versions of modified and deleted objects, and all of the objects
+    # that use them. A node moving changes the geometry of its ways, and a way
+    # changing (getting a bus lane, for example) affects its route relations.
+    # This must happen before the changes are applied.
+    ids = set(f"{osmType}{osmID}" for (osmType, osmID, _) in changed)
+    old = getObjects(osm_input, ids, f"{tmp}/old.osm")
+    parents = getParents(osm_input, ids, tmp)
+
+    layers = findAffectedLayers(changed + old + parents)
+    print(f"Changes affect these layers: {', '.join(layers) or 'none'}")
+
+    # Write next to the input, so the final rename doesn't cross disks
+    updated = f"{osm_input}.updated.osm.pbf"
+    run(
+        ["osmium", "apply-changes", osm_input]
+        + changeFiles
+        + ["-o", updated, "--overwrite"]
+    )
+    os.replace(updated, osm_input)
+
+    return layers
+
+
+# Returns the names of the layers that any of the objects belong to. Each
+# object is a tuple (osmType, osmID, tags), where osmType is n, w, or r.
+def findAffectedLayers(objects):
+    affected = set()
+    for osmType, osmID, tags in objects:
+        for layer, tagFilter in osm.tagFilters.items():
+            if matchesTagFilter(tagFilter, osmType, tags):
+                affected.add(layer)
+
+        # Most highways aren't cycle paths, so check more precisely
+        if matchesTagFilter(cycle_paths.tagFilter, osmType, tags):
+            if cycle_paths.getProps(dict(tags, **{"@id": osmID})) != None:
+                affected.add("cycle_paths")
+    return sorted(affected)
+
+
+# Handles the simple osmium tags-filter expressions used in this repo, like
+# "nwr/amenity=school,college" or "w/highway"
+def matchesTagFilter(tagFilter, osmType, tags):
+    types, expression = tagFilter.split("/", 1)
+    if osmType not in types:
+        return False
+    if "=" not in expression:
+        return expression in tags
+    key, values = expression.split("=", 1)
+    return tags.get(key) in values.split(",")
+
+
+# Parses an OSM XML or osmChange file, returning a list of (osmType, osmID,
+# tags) tuples
+def readOsmXml(path):
+    objects = []
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for _, element in ET.iterparse(f):
+            if element.tag not in ["node", "way", "relation"]:
+                continue
+            tags = {}
+            for tag in element.iter("tag"):
+                tags[tag.get("k")] = tag.get("v")
+            objects.append((element.tag[0], element.get("id"), tags))
+            element.clear()
+    return objects
+
+
+# Finds the current version of any objects from ids (like "n123" or "w456")
+# that exist in osmPath
+def getObjects(osmPath, ids, outputPath):
+    if not ids:
+        return []
+    idsPath = f"{outputPath}.ids"
+    with open(idsPath, "w") as f:
+        f.write("\n".join(sorted(ids)))
+
+    args = ["osmium", "getid", osmPath, "-i", idsPath, "-o", outputPath, "--overwrite"]
+    print(">", " ".join(args))
+    # getid fails when some IDs are missing, which is expected for newly created
+    # objects
+    subprocess.run(args)
+    if not os.path.exists(outputPath):
+        raise Exception(f"osmium getid didn't produce {outputPath}")
+    return readOsmXml(outputPath)
+
+
+# Finds all ways and relations in osmPath using the objects from ids, and the
+# relations using those ways
+def getParents(osmPath, ids, tmp):
+    parents = []
+    for depth in range(2):
+        ids = set(i for i in ids if i[0] != "r")
+        if not ids:
+            break
+        idsPath = f"{tmp}/parents{depth}.ids"
+        outputPath = f"{tmp}/parents{depth}.osm"
+        with open(idsPath, "w") as f:
+            f.write("\n".join(sorted(ids)))
+        run(
+            [
+                "osmium",
+                "getparents",
+                osmPath,
+                "-i",
+                idsPath,
+                "-o",
+                outputPath,
+                "--overwrite",
+            ]
+        )
+        found = readOsmXml(outputPath)
+        parents.extend(found)
+        ids = set(f"{osmType}{osmID}" for (osmType, osmID, _) in found)
+    return parents
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+import osm_changes
+
+
+class TestFindAffectedLayers(unittest.TestCase):
+    def test_changeFile(self):
+        # A hand-made diff: a new school, a retagged cycleway, and a deleted node
+        # without tags
+        osc = """<?xml version='1.0' encoding='UTF-8'?>
+<osmChange version="0.6" generator="hand">
+  <create>
+    <node id="-1" version="1" lat="51.5" lon="-0.1">
+      <tag k="amenity" v="school"/>
+      <tag k="name" v="New school"/>
+    </node>
+  </create>
+  <modify>
+    <way id="29063778" version="2">
+      <nd ref="1"/>
+      <nd ref="2"/>
+      <tag k="highway" v="cycleway"/>
+      <tag k="oneway" v="yes"/>
+    </way>
+  </modify>
+  <delete>
+    <node id="3" version="4" lat="51.5" lon="-0.1"/>
+  </delete>
+</osmChange>
+"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.osc")
+            with open(path, "w") as f:
+                f.write(osc)
+            objects = osm_changes.readOsmXml(path)
+
+        self.assertEqual(
+            objects,
+            [
+                ("n", "-1", {"amenity": "school", "name": "New school"}),
+                ("w", "29063778", {"highway": "cycleway", "oneway": "yes"}),
+                ("n", "3", {}),
+            ],
+        )
+        self.assertEqual(
+            osm_changes.findAffectedLayers(objects), ["cycle_paths", "education"]
+        )
+
+    def test_onlyCyclePathsAffected(self):
+        for tags, expected in [
+            ({"highway": "residential"}, []),
+            ({"highway": "residential", "cycleway:left": "lane"}, ["cycle_paths"]),
+            ({"highway": "footway", "bicycle": "designated"}, ["cycle_paths"]),
+        ]:
+            self.assertEqual(
+                osm_changes.findAffectedLayers([("w", "1", tags)]), expected
+            )
+
+    def test_matchesTagFilter(self):
+        self.assertTrue(
+            osm_changes.matchesTagFilter(
+                "nwr/railway=tram,light_rail", "w", {"railway": "light_rail"}
+            )
+        )
+        self.assertFalse(
+            osm_changes.matchesTagFilter(
+                "n/railway=station", "w", {"railway": "station"}
+            )
+        )
+        self.assertFalse(
+            osm_changes.matchesTagFilter("r/route=bus", "r", {"route": "train"})
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,11 @@
+import math
+from collections import defaultdict
+
 from utils import *
 
 
-def makePct():
-    tmp = "tmp_pct"
-    ensureEmptyTempDirectoryExists(tmp)
+def makePct(combine=False):
+    tmp = ensureEmptyTempDirectoryExists("tmp_pct", estimatedBytes=1 * GB)
 
     run(
         [
@@ -24,8 +26,9 @@ def makePct():
     )
 
     # The two trip purposes are split into different files, and neither feature
-    # ID nor the local_id property matches between them. So just output two
-    # separate files.
+    # ID nor the local_id property matches between them. By default, just
+    # output two separate files. With combine, match up segments by geometry
+    # and output one file.
 
     def fixProps(inputProps):
         return {
@@ -35,20 +38,159 @@ def makePct():
         }
 
     cleanUpGeojson(f"{tmp}/commute.geojson", fixProps)
-    convertGeoJsonToPmtiles(
-        f"{tmp}/commute.geojson",
-        f"output/pct_commute.pmtiles",
-        args=["--drop-densest-as-needed"],
-    )
-
     # The school network is missing counts on many features
     cleanUpGeojson(
         f"{tmp}/school.geojson",
         fixProps,
         filterFeatures=lambda f: f["properties"]["bicycle"] is not None,
     )
+
+    if combine:
+        combineNetworks(
+            f"{tmp}/commute.geojson", f"{tmp}/school.geojson", f"{tmp}/pct.geojson"
+        )
+        convertGeoJsonToPmtiles(
+            f"{tmp}/pct.geojson",
+            f"output/pct.pmtiles",
+            args=["--drop-densest-as-needed"],
+            importance=lambda f: f["properties"].get("commute_baseline", 0)
+            + f["properties"].get("school_baseline", 0),
+        )
+        return
+
+    convertGeoJsonToPmtiles(
+        f"{tmp}/commute.geojson",
+        f"output/pct_commute.pmtiles",
+        args=["--drop-densest-as-needed"],
+        importance=lambda f: f["properties"]["baseline"],
+    )
     convertGeoJsonToPmtiles(
         f"{tmp}/school.geojson",
         f"output/pct_school.pmtiles",
         args=["--drop-densest-as-needed"],
+        importance=lambda f: f["properties"]["baseline"],
+    )
+
+
+# Writes one network with commute_baseline, school_baseline, etc properties.
+# Segments are the same in both networks if their geometry rounded to about 1m
+# matches, in either direction. Otherwise, a school segment whose endpoints are
+# both within about 10m of a commute segment's, and whose length is about the
+# same, is used. The length check stops different links between the same two
+# junctions from matching. Segments only in one network just have properties
+# for that purpose. Every segment must be a LineString.
+def combineNetworks(commutePath, schoolPath, outputPath):
+    school = list(readFeatures(schoolPath))
+    byGeometry = {}
+    # Grid cell to the indices of school segments with an endpoint there
+    byEndpoint = defaultdict(list)
+    for idx, feature in enumerate(school):
+        coordinates = lineCoordinates(feature)
+        byGeometry.setdefault(geometryKey(coordinates), idx)
+        for pt in [coordinates[0], coordinates[-1]]:
+            byEndpoint[nearMatchCell(pt)].append(idx)
+
+    matched = set()
+    counts = defaultdict(int)
+
+    def findSchool(coordinates):
+        idx = byGeometry.get(geometryKey(coordinates))
+        if idx is not None and idx not in matched:
+            counts["exact"] += 1
+            return idx
+        start, end = coordinates[0], coordinates[-1]
+        x, y = nearMatchCell(start)
+        for dx in [-1, 0, 1]:
+            for dy in [-1, 0, 1]:
+                for idx in byEndpoint.get((x + dx, y + dy), []):
+                    if idx in matched:
+                        continue
+                    other = school[idx]["geometry"]["coordinates"]
+                    sameEnds = (isNear(start, other[0]) and isNear(end, other[-1])) or (
+                        isNear(start, other[-1]) and isNear(end, other[0])
+                    )
+                    if sameEnds and similarLength(coordinates, other):
+                        counts["near"] += 1
+                        return idx
+        return None
+
+    def features():
+        for feature in readFeatures(commutePath):
+            props = prefixProps("commute", feature["properties"])
+            idx = findSchool(lineCoordinates(feature))
+            if idx is not None:
+                matched.add(idx)
+                props.update(prefixProps("school", school[idx]["properties"]))
+            feature["properties"] = props
+            yield feature
+        for idx, feature in enumerate(school):
+            if idx not in matched:
+                feature["properties"] = prefixProps("school", feature["properties"])
+                yield feature
+
+    numFeatures = 0
+
+    def numbered():
+        nonlocal numFeatures
+        for feature in features():
+            numFeatures += 1
+            feature["id"] = numFeatures
+            yield feature
+
+    writeFeatureCollection(outputPath, numbered())
+    print(
+        f"Combined PCT networks into {numFeatures} segments. {counts['exact']} matched exactly, {counts['near']} nearly, and {len(school) - len(matched)} are only in the school network"
+    )
+
+
+def lineCoordinates(feature):
+    geometry = feature["geometry"]
+    if geometry["type"] != "LineString":
+        raise Exception(f"Can't combine PCT segments of type {geometry['type']}")
+    return geometry["coordinates"]
+
+
+def prefixProps(prefix, props):
+    return {f"{prefix}_{key}": value for key, value in props.items()}
+
+
+# The same for a LineString drawn in either direction
+def geometryKey(coordinates):
+    forwards = tuple((round(pt[0], 5), round(pt[1], 5)) for pt in coordinates)
+    return min(forwards, forwards[::-1])
+
+
+# Degrees, about 10m
+nearMatchDistance = 0.0001
+
+
+def nearMatchCell(pt):
+    return (
+        math.floor(pt[0] / nearMatchDistance),
+        math.floor(pt[1] / nearMatchDistance),
+    )
+
+
+def isNear(pt1, pt2):
+    return (
+        abs(pt1[0] - pt2[0]) <= nearMatchDistance
+        and abs(pt1[1] - pt2[1]) <= nearMatchDistance
+    )
+
+
+# Near matches can differ in length by this fraction
+lengthTolerance = 0.1
+
+
+def similarLength(coordinates1, coordinates2):
+    length1 = lineLength(coordinates1)
+    length2 = lineLength(coordinates2)
+    return abs(length1 - length2) <= lengthTolerance * max(length1, length2)
+
+
+# In degrees, which is enough to compare nearby lines
+def lineLength(coordinates):
+    return sum(
+        math.hypot(b[0] - a[0], b[1] - a[1])
+        for a, b in zip(coordinates, coordinates[1:])
     )
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from pct import combineNetworks, geometryKey
+from utils import readFeatures, writeFeatureCollection
+
+
+def segment(baseline, *coordinates):
+    return {
+        "type": "Feature",
+        "properties": {"baseline": baseline},
+        "geometry": {"type": "LineString", "coordinates": list(coordinates)},
+    }
+
+
+class TestCombineNetworks(unittest.TestCase):
+    def combine(self, commute, school):
+        with tempfile.TemporaryDirectory() as tmp:
+            commutePath = os.path.join(tmp, "commute.geojson")
+            schoolPath = os.path.join(tmp, "school.geojson")
+            outputPath = os.path.join(tmp, "pct.geojson")
+            writeFeatureCollection(commutePath, commute)
+            writeFeatureCollection(schoolPath, school)
+            combineNetworks(commutePath, schoolPath, outputPath)
+            return [feature["properties"] for feature in readFeatures(outputPath)]
+
+    def test_matches(self):
+        self.assertEqual(
+            self.combine(
+                [
+                    segment(1, [0, 0], [0.01, 0]),
+                    segment(2, [1, 0], [1.01, 0]),
+                    segment(3, [2, 0], [2.01, 0]),
+                    segment(4, [3, 0], [3.01, 0]),
+                ],
+                [
+                    # Exactly the same, after rounding
+                    segment(10, [0.000001, 0], [0.01, 0]),
+                    # Reversed
+                    segment(20, [1.01, 0], [1, 0]),
+                    # Endpoints about 5m away
+                    segment(30, [2.00005, 0], [2.01, 0.00005]),
+                    # Nowhere near
+                    segment(50, [5, 0], [5.01, 0]),
+                ],
+            ),
+            [
+                {"commute_baseline": 1, "school_baseline": 10},
+                {"commute_baseline": 2, "school_baseline": 20},
+                {"commute_baseline": 3, "school_baseline": 30},
+                {"commute_baseline": 4},
+                {"school_baseline": 50},
+            ],
+        )
+
+    def test_different_links_between_same_junctions(self):
+        # A straight link and a much longer loop both join [0, 0] to [0.01, 0]
+        self.assertEqual(
+            self.combine(
+                [segment(1, [0, 0], [0.01, 0])],
+                [segment(10, [0, 0], [0, 0.01], [0.01, 0.01], [0.01, 0])],
+            ),
+            [{"commute_baseline": 1}, {"school_baseline": 10}],
+        )
+
+    def test_rejects_multilinestring(self):
+        multi = {
+            "type": "Feature",
+            "properties": {"baseline": 1},
+            "geometry": {
+                "type": "MultiLineString",
+                "coordinates": [[[0, 0], [1, 0]], [[2, 0], [3, 0]]],
+            },
+        }
+        with self.assertRaises(Exception):
+            self.combine([multi], [segment(10, [0, 0], [1, 0])])
+        with self.assertRaises(Exception):
+            self.combine([segment(1, [0, 0], [1, 0])], [multi])
+
+    def test_geometryKey(self):
+        self.assertEqual(
+            geometryKey([[0, 0], [1, 1], [2, 0]]),
+            geometryKey([[2, 0], [1, 1], [0, 0]]),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
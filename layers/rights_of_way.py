@@ -1,11 +1,15 @@
 import json
+import math
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
 from utils import *
+import line_merge
 
 
-def makeRoW():
-    tmp = "tmp_rights_of_way"
-    ensureEmptyTempDirectoryExists(tmp)
+def makeRoW(mergeLines=False):
+    tmp = ensureEmptyTempDirectoryExists("tmp_rights_of_way", estimatedBytes=2 * GB)
 
     # Scrape https://www.rowmaps.com/jsons/. Manually uncomment and run with
     # caution; do not overload their server.
@@ -26,38 +30,79 @@ def makeRoW():
             ]
         )
 
-    output = {
-        "type": "FeatureCollection",
-        "features": [],
-    }
-
-    # Walk through the directory of downloaded files
+    # Parse each county's files in parallel, each writing its own GeoJSONSeq
+    # part. Sort, so the output is the same every time.
     root_dir = "rowmaps/www.rowmaps.com/jsons"
-    for dir_name in os.listdir(root_dir):
+    jobs = []
+    for dir_name in sorted(os.listdir(root_dir)):
         if dir_name == "index.html":
             continue
-        for filename in os.listdir(os.path.join(root_dir, dir_name)):
-            if filename.startswith("mutated") and filename.endswith(".json"):
-                with open(os.path.join(root_dir, dir_name, filename)) as f:
-                    gj = json.load(f)
-
-                    # Copy features over, overwriting properties
-                    for f in gj["features"]:
-                        f["properties"] = {
-                            "kind": {
-                                "mutated1.json": "footpath",
-                                "mutated2.json": "bridleway",
-                                "mutated3.json": "restricted byway",
-                                "mutated4.json": "byway open to all traffic",
-                            }[filename]
-                        }
-                    output["features"].extend(gj["features"])
-
-    with open(f"{tmp}/rights_of_way.geojson", "w") as f:
-        f.write(json.dumps(output))
+        for filename in sorted(os.listdir(os.path.join(root_dir, dir_name))):
+            if filename in kinds:
+                jobs.append(
+                    (
+                        os.path.join(root_dir, dir_name, filename),
+                        f"{tmp}/part{len(jobs):05}.geojsonl",
+                    )
+                )
+    with ProcessPoolExecutor() as pool:
+        parts = list(pool.map(convertFile, jobs))
+
+    # Concatenate in order, without loading anything
+    path = f"{tmp}/rights_of_way.geojsonl"
+    with open(path, "wb") as output:
+        for part in parts:
+            with open(part, "rb") as f:
+                shutil.copyfileobj(f, output)
+            os.remove(part)
+    if mergeLines:
+        line_merge.mergeTouchingLines(path)
+
     convertGeoJsonToPmtiles(
-        f"{tmp}/rights_of_way.geojson",
+        path,
         "output/rights_of_way.pmtiles",
         autoZoom=True,
         args=["--drop-densest-as-needed"],
+        parallelInput=True,
+        importance=lineLength,
     )
+
+
+kinds = {
+    "mutated1.json": "footpath",
+    "mutated2.json": "bridleway",
+    "mutated3.json": "restricted byway",
+    "mutated4.json": "byway open to all traffic",
+}
+
+
+# Longer routes are kept at lower zooms. This is in degrees, with longitude
+# scaled for England's latitude, which is enough to compare lines.
+def lineLength(feature):
+    geometry = feature["geometry"]
+    if geometry["type"] == "LineString":
+        lines = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiLineString":
+        lines = geometry["coordinates"]
+    else:
+        return 0
+    length = 0
+    for line in lines:
+        for a, b in zip(line, line[1:]):
+            length += math.hypot((b[0] - a[0]) * 0.6, b[1] - a[1])
+    return length
+
+
+# Writes the features from one of the downloaded files as GeoJSONSeq,
+# overwriting properties
+def convertFile(job):
+    inputPath, outputPath = job
+    kind = kinds[os.path.basename(inputPath)]
+    with open(inputPath) as f:
+        gj = json.load(f)
+    with open(outputPath, "w") as f:
+        for feature in gj["features"]:
+            feature["properties"] = {"kind": kind}
+            f.write(json.dumps(feature))
+            f.write("\n")
+    return outputPath
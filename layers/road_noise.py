@@ -1,9 +1,9 @@
 from utils import *
+from dissolve import dissolvePolygons
 
 
 def makeRoadNoise():
-    tmp = "tmp_road_noise"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists("tmp_road_noise", estimatedBytes=5 * GB)
 
     # From https://environment.data.gov.uk/dataset/b9c6bf30-a02d-4378-94a0-2982de1bef86
     run(
@@ -16,18 +16,19 @@ def makeRoadNoise():
     )
     run(["unzip", f"{tmp}/input.zip", "-d", tmp])
 
-    # Note the JSON file isn't GeoJSON, but ogr2ogr manages to understand it
+    # Note the JSON file isn't GeoJSON, but ogr2ogr manages to understand it.
+    # Only keep noiseclass.
     reprojectToWgs84(
         f"{tmp}/data/Road_Noise_LAeq16h_England_Round_3.json",
         f"{tmp}/road_noise.geojson",
+        columns=["noiseclass"],
+        clipToEngland=True,
+        precision=6,
     )
 
-    def fixProps(inputProps):
-        return {
-            "noiseclass": inputProps["noiseclass"],
-        }
-
-    cleanUpGeojson(f"{tmp}/road_noise.geojson", fixProps)
+    # Most adjacent polygons have the same noiseclass, so merge them. This also
+    # adds IDs.
+    dissolvePolygons(f"{tmp}/road_noise.geojson", "noiseclass")
     convertGeoJsonToPmtiles(
         f"{tmp}/road_noise.geojson",
         f"output/road_noise.pmtiles",
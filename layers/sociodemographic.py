@@ -0,0 +1,325 @@
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+import subprocess
+import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from arcgis_download import downloadFeatureLayer, findLayerUrl, getLastEditDate
+from banding import band, deciles, pivotCategories
+from geometry_cache import cacheGeometry, readGeometry
+
+# Inputs, relative to the working directory. Only the OA geometry and IMD are
+# downloaded automatically; the rest must be manually put in place first.
+#
+# From https://www.nomisweb.co.uk/sources/census_2021_bulk, download TS001 and
+# extract it into the working directory. The car ownership file comes from
+# https://static.ons.gov.uk/datasets/a20437fb-ae7f-439b-bc91-de261335038b/TS045-2021-3-filtered-2023-03-13T16:49:47Z.csv
+# (downloading it with wget doesn't work). LSOA geometry comes from
+# https://geoportal.statistics.gov.uk/datasets/766da1380a3544c5a7ca9131dfd4acb6/explore
+output_areas_serviceItemID = "6c6743e1e4b444f6afcab9d9588f5d8f"
+output_areas_geojson_file = "oa_from_agol.geojson"
+lsoa_geojson_file = "LSOA_Dec_2021_Boundaries_Generalised_Clipped_EW_BGC_2022_5605507071095448309.geojson"
+carOwnerFile = "TS045-2021-3-filtered-2023-03-13T16 49 47Z.csv"
+oa_pop_file = "census2021-ts001/census2021-ts001-oa.csv"
+businesses_csv_file = "businessRegistry.csv"
+IMD_serviceItemID = "4ad3e5a10872455eaa67ce4e663d0d01"
+
+# Outputs, relative to the working directory
+cars_output_file = "outputs/car-ownership-layer.geojson"
+IMD_output_file = "outputs/imd-2019.geojson"
+pop_dens_output_file = "outputs/pop-density-layer.geojson"
+emp_dens_output_file = "outputs/emp-density-layer.geojson"
+
+
+def makeSociodemographicLayers(workingDir):
+    """
+    Makes all of the sociodemographic layers in `workingDir`/outputs. The sub-layers don't depend on each other, so they run concurrently, and each is skipped if its output is newer than all of its inputs.
+    """
+    os.makedirs(f"{workingDir}/outputs", exist_ok=True)
+    output_areas_geojson_path = f"{workingDir}/{output_areas_geojson_file}"
+
+    # Both the car ownership and population density layers need this first
+    download_from_arcgis_online(
+        output_areas_serviceItemID, output_areas_geojson_path, force=False
+    )
+    # Both read it, so convert it to GeoParquet before they start
+    cacheGeometry(output_areas_geojson_path, f"{workingDir}/geometry_cache")
+
+    with ProcessPoolExecutor() as pool:
+        jobs = [
+            pool.submit(
+                download_from_arcgis_online,
+                IMD_serviceItemID,
+                f"{workingDir}/{IMD_output_file}",
+                force=False,
+            ),
+            pool.submit(
+                getCarOwnershipLayer,
+                workingDir,
+                output_areas_geojson_path,
+                carOwnerFile,
+                cars_output_file,
+            ),
+            pool.submit(
+                getPopDensityLayer,
+                workingDir,
+                f"{workingDir}/{oa_pop_file}",
+                output_areas_geojson_path,
+                pop_dens_output_file,
+            ),
+            pool.submit(
+                getEmpDensityLayer,
+                workingDir,
+                f"{workingDir}/{businesses_csv_file}",
+                f"{workingDir}/{lsoa_geojson_file}",
+                emp_dens_output_file,
+            ),
+        ]
+        # Raise any errors
+        for job in jobs:
+            job.result()
+
+
+# Code from https://github.com/dabreegster/popgetter/tree/main
+def _last_update(file_path):
+    """
+    Returns the date and time of the last update to the file at `file_path`.
+    """
+    if not os.path.exists(file_path):
+        return None
+    last_update = os.path.getmtime(file_path)
+    return datetime.datetime.fromtimestamp(last_update)
+
+
+def isUpToDate(output_file, input_files):
+    """
+    Is `output_file` newer than every file in `input_files`? The same check `download_from_arcgis_online` uses against the layer's last edit.
+    """
+    output_last_edit = _last_update(output_file)
+    if not output_last_edit:
+        return False
+    for input_file in input_files:
+        input_last_edit = _last_update(input_file)
+        if not input_last_edit or input_last_edit >= output_last_edit:
+            return False
+    print(f"Output file is up-to-date: {output_file}")
+    return True
+
+
+def writeGeoJson(gdf, output_file):
+    """
+    Writes a GeoDataFrame as GeoJSON using pyogrio, which is much faster than fiona. The file is written elsewhere first, so an interrupted run doesn't leave a partial output that looks up-to-date.
+    """
+    partial_file = f"{output_file}.partial"
+    gdf.to_file(partial_file, driver="GeoJSON", engine="pyogrio")
+    os.replace(partial_file, output_file)
+
+
+# Based on code from https://github.com/dabreegster/popgetter/tree/main
+def download_from_arcgis_online(serviceItemId, output_file, layer=0, force=False):
+    """
+    Downloads data from ArcGIS Online and saves it to a file (`output_file`). This function can only download data that is available to anonymous users.
+    The data will only be downloaded if the output file does not exist, or if the data on ArcGIS Online has been updated since the output file was last updated. Use `force=True` will cause the data to be re-downloaded if it an uptodate file exists locally.
+    The download is paged and can resume after a failure; see `arcgis_download.downloadFeatureLayer`.
+    """
+    layerUrl = findLayerUrl(serviceItemId, layer)
+    print(f"Got layer: {layerUrl}")
+
+    # Epoch time in milliseconds - convert to datetime
+    lyr_last_edit = getLastEditDate(layerUrl)
+    if lyr_last_edit:
+        lyr_last_edit = datetime.datetime.fromtimestamp(lyr_last_edit / 1000)
+
+    print(f"last_edit: {lyr_last_edit}")
+
+    # If the output file exists, check the last edit time
+    output_last_edit = _last_update(output_file)
+
+    if (
+        not force
+        and output_last_edit
+        and lyr_last_edit
+        and output_last_edit > lyr_last_edit
+    ):
+        print(f"Output file is up-to-date: {output_file}")
+        return
+
+    print(f"Output file is out-of-date: {output_file}")
+
+    downloadFeatureLayer(layerUrl, output_file)
+
+    print("Done")
+
+
+# Code from https://github.com/dabreegster/popgetter/tree/main
+def download_vehicle_ownership(census_url, working_dir):
+    print("Retrieving Vehicle Ownership Census Data")
+    result = subprocess.check_call(["wget", "-N", census_url], cwd=working_dir)
+    print(f"result = {result}")
+
+
+# %% Layers
+
+
+def getCarOwnershipLayer(
+    working_dir, output_areas_geojson_path, carOwnerFile, output_file
+):
+    """
+    Reads in OA geometries data and car ownership, created bandings at OA level and outputs as geoJson.
+    """
+    carOwnerPath = f"{working_dir}/{carOwnerFile}"
+    if isUpToDate(
+        f"{working_dir}/{output_file}", [output_areas_geojson_path, carOwnerPath]
+    ):
+        return
+
+    print("----------")
+    print("Getting data")
+
+    # Get Car Ownership Census Data
+
+    # Below code not working - cannot find file (althugh URL work in a web browser)
+    # To work around download file from below url and save in working_dir
+
+    # CENSUS_URL = "https://static.ons.gov.uk/datasets/a20437fb-ae7f-439b-bc91-de261335038b/TS045-2021-3-filtered-2023-03-13T16:49:47Z.csv"
+    # download_vehicle_ownership(CENSUS_URL, working_dir)
+
+    # Read data in
+    # OAs shapefile as geopandas dataframe, only loading the columns needed
+    oas = readGeometry(
+        output_areas_geojson_path, ["OA21CD"], f"{working_dir}/geometry_cache"
+    )
+    print("OA Geometry Read In")
+
+    # Car ownership data
+    carsRaw = pd.read_csv(carOwnerPath)
+    print("Car Ownership Read In")
+
+    # Cars
+
+    # One column per car availability category, in a single pass. The category code is the number of cars, with 3 meaning 3+, and -8 for households it doesn't apply to.
+    counts = pivotCategories(
+        carsRaw,
+        "Output Areas Code",
+        "Car or van availability (5 categories) Code",
+        "Observation",
+    )
+    cars = counts.reindex(columns=[0, 1, 2, 3], fill_value=0).rename(
+        columns={0: "0 Cars", 1: "1 Car", 2: "2 Car", 3: "3+ Cars"}
+    )
+    # Total number of cars per OA
+    cars["Total"] = counts.sum(axis=1)
+    # Percentage of households with a car
+    cars["Pcnt HH With Car"] = 1 - (cars["0 Cars"] / cars["Total"])
+    # Weighted average cars per hh, over however many categories there are
+    numCars = counts.columns.to_numpy().clip(min=0)
+    cars["Avg Cars per HH"] = (counts * numCars).sum(axis=1) / cars["Total"]
+
+    print("Bandings formed")
+
+    # Banding Percent HH with Car
+    cars["Pcnt HH With Car Bands"] = band(
+        cars["Pcnt HH With Car"],
+        [0.4, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1],
+        default=99,
+    )
+    print(cars["Pcnt HH With Car Bands"].value_counts())
+
+    # Banding weighted average cars per HH
+    cars["Avg Cars per HH Bands"] = band(
+        cars["Avg Cars per HH"], [0.5, 0.75, 1, 1.25, 1.5, 1.75]
+    )
+    print(cars["Avg Cars per HH Bands"].value_counts())
+
+    # Output data
+    print("Outputting Data")
+    output_data = oas[["OA21CD", "geometry"]].merge(
+        cars, left_on="OA21CD", right_index=True
+    )
+    writeGeoJson(output_data, f"{working_dir}/{output_file}")
+    print("Car Ownership Layer Output")
+    print("----------")
+
+
+def getPopDensityLayer(
+    working_dir, oa_pop_path, output_areas_geojson_path, pop_dens_output_file
+):
+    """
+    Reads in OA geometries data and population distribution, calculates population densite and splits into deciles, then outputs as geoJson.
+    """
+    if isUpToDate(
+        f"{working_dir}/{pop_dens_output_file}",
+        [oa_pop_path, output_areas_geojson_path],
+    ):
+        return
+
+    # Instruction to get data:
+    # From https://www.nomisweb.co.uk/sources/census_2021_bulk download TS001.csv and extract into working directory
+
+    # Read in OA Population File
+    oa_pop = pd.read_csv(oa_pop_path)
+    print("----------")
+    print("Population data read in")
+
+    # Read in OA Geometry, only loading the columns needed
+    oas = readGeometry(
+        output_areas_geojson_path,
+        ["OA21CD", "Shape__Area"],
+        f"{working_dir}/geometry_cache",
+    )
+    print("OA geometry data read in")
+
+    # Merge geometry and population data on OA identifier
+    oas = oas.merge(oa_pop, left_on="OA21CD", right_on="geography")
+    # Create Population Density Field
+    oas["pop_density"] = (
+        oas["Residence type: Total; measures: Value"] / oas["Shape__Area"]
+    ) * 1000
+    # Split into deciles
+    oas["pop_density_deciles"] = deciles(oas["pop_density"])
+
+    print(oas["pop_density_deciles"].value_counts())
+
+    # Output File
+    print("Outputting data")
+    writeGeoJson(oas, f"{working_dir}/{pop_dens_output_file}")
+    print("Data output")
+    print("----------")
+
+
+def getEmpDensityLayer(
+    working_dir, businesses_csv_file, lsoa_geojson_path, emp_dens_output_file
+):
+    """
+    Reads in LSOA geometries data and business data (with copmany size in employees), calculates employement density at LSOA level and splits into deciles, then outputs as geoJson.
+    """
+    if isUpToDate(
+        f"{working_dir}/{emp_dens_output_file}",
+        [businesses_csv_file, lsoa_geojson_path],
+    ):
+        return
+
+    print("----------")
+
+    businesses = pd.read_csv(businesses_csv_file)
+    number_jobs_lsoa = businesses.groupby("LSOA11CD").sum()["size"]
+    print("Businesses data read")
+
+    lsoas = readGeometry(
+        lsoa_geojson_path, ["LSOA21CD"], f"{working_dir}/geometry_cache"
+    )
+    print("LSOAs data read")
+
+    lsoas["area"] = lsoas["geometry"].area / 1000
+    lsoas = lsoas.merge(number_jobs_lsoa, left_on="LSOA21CD", right_index=True)
+    lsoas["emp_density"] = lsoas["size"] / lsoas["area"]
+    lsoas["emp_density_deciles"] = deciles(lsoas["emp_density"])
+    print("Employment density calculated")
+    print(lsoas["emp_density_deciles"].value_counts())
+
+    print("Outputting data")
+    writeGeoJson(lsoas, f"{working_dir}/{emp_dens_output_file}")
+    print("Data output")
+    print("----------")
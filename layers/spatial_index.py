@@ -0,0 +1,300 @@
+import json
+import math
+from collections import defaultdict
+
+# Relative to the layers directory, where generate_layers.py runs
+AUTHORITIES_PATH = "../authorities.geojson"
+
+_authorities = None
+
+
+# Returns a SpatialIndex over authorities.geojson, only loading it once
+def loadAuthorities():
+    global _authorities
+    if _authorities is None:
+        with open(AUTHORITIES_PATH) as f:
+            _authorities = SpatialIndex(json.load(f)["features"])
+    return _authorities
+
+
+# Finds which polygons contain points or intersect lines. Every polygon's
+# bounding box is added to the cells of a regular grid, so a lookup only does
+# exact tests against the few polygons near the query.
+class SpatialIndex:
+    # Takes a list of GeoJSON features with Polygon or MultiPolygon geometry.
+    # cellSize is in degrees.
+    def __init__(self, features, cellSize=0.1):
+        self.cellSize = cellSize
+        # Per feature: properties, bounding box, and a list of PreparedPolygons
+        self.properties = []
+        self.bboxes = []
+        self.polygons = []
+        # (column, row) to a list of feature indices
+        self.grid = defaultdict(list)
+
+        for feature in features:
+            geometry = feature["geometry"]
+            if geometry["type"] == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry["type"] == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                raise Exception(f"Can't index {geometry['type']}")
+            polygons = [PreparedPolygon(polygon) for polygon in polygons]
+
+            xs = [pt[0] for polygon in polygons for pt in polygon.rings[0]]
+            ys = [pt[1] for polygon in polygons for pt in polygon.rings[0]]
+            bbox = (min(xs), min(ys), max(xs), max(ys))
+
+            idx = len(self.properties)
+            self.properties.append(feature["properties"])
+            self.bboxes.append(bbox)
+            self.polygons.append(polygons)
+            for cell in self._cells(bbox):
+                self.grid[cell].append(idx)
+
+    def _cells(self, bbox):
+        x1, y1, x2, y2 = [math.floor(value / self.cellSize) for value in bbox]
+        for column in range(x1, x2 + 1):
+            for row in range(y1, y2 + 1):
+                yield (column, row)
+
+    # Returns the indices of features whose bounding box overlaps bbox
+    def candidates(self, bbox):
+        result = set()
+        for cell in self._cells(bbox):
+            for idx in self.grid.get(cell, []):
+                if bboxesOverlap(self.bboxes[idx], bbox):
+                    result.add(idx)
+        return sorted(result)
+
+    # Returns the indices of features containing the point
+    def lookupPoint(self, x, y):
+        cell = (math.floor(x / self.cellSize), math.floor(y / self.cellSize))
+        result = []
+        for idx in self.grid.get(cell, []):
+            bbox = self.bboxes[idx]
+            if bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]:
+                if any(polygon.contains(x, y) for polygon in self.polygons[idx]):
+                    result.append(idx)
+        return result
+
+    # Returns the indices of features touching a LineString's coordinates
+    def lookupLine(self, coordinates):
+        xs = [pt[0] for pt in coordinates]
+        ys = [pt[1] for pt in coordinates]
+        result = []
+        for idx in self.candidates((min(xs), min(ys), max(xs), max(ys))):
+            if any(
+                lineIntersectsPolygon(coordinates, polygon)
+                for polygon in self.polygons[idx]
+            ):
+                result.append(idx)
+        return result
+
+    # Returns the indices of features touching any GeoJSON geometry
+    def lookupGeometry(self, geometry):
+        coordinates = geometry["coordinates"]
+        geometryType = geometry["type"]
+        if geometryType == "Point":
+            return self.lookupPoint(coordinates[0], coordinates[1])
+        if geometryType == "LineString":
+            return self.lookupLine(coordinates)
+        # A polygon is in an authority if its boundary is, so treat the outer
+        # ring as a line
+        if geometryType == "Polygon":
+            return self.lookupLine(coordinates[0])
+
+        if geometryType == "MultiPoint":
+            results = [self.lookupPoint(pt[0], pt[1]) for pt in coordinates]
+        elif geometryType == "MultiLineString":
+            results = [self.lookupLine(line) for line in coordinates]
+        elif geometryType == "MultiPolygon":
+            results = [self.lookupLine(polygon[0]) for polygon in coordinates]
+        else:
+            raise Exception(f"Can't look up {geometryType}")
+        return sorted(set(idx for result in results for idx in result))
+
+    # Adds a property per authority level (LAD or TA) to a GeoJSON feature,
+    # with the name of the authorities it's in. A feature crossing a boundary
+    # gets multiple names, separated by semicolons.
+    def tagFeature(self, feature):
+        names = defaultdict(list)
+        for idx in self.lookupGeometry(feature["geometry"]):
+            props = self.properties[idx]
+            names[props["level"]].append(props["name"])
+        for level, values in names.items():
+            feature["properties"][level] = ";".join(values)
+
+
+# A polygon with its edges split into horizontal bands, so a point-in-polygon
+# test only looks at the edges near the point
+class PreparedPolygon:
+    # Takes GeoJSON Polygon coordinates
+    def __init__(self, coordinates):
+        self.rings = [[(pt[0], pt[1]) for pt in ring] for ring in coordinates]
+
+        edges = []
+        for ring in self.rings:
+            for i in range(len(ring) - 1):
+                edges.append((ring[i], ring[i + 1]))
+
+        ys = [pt[1] for pt in self.rings[0]]
+        self.minY = min(ys)
+        numBands = max(1, len(edges) // 4)
+        self.bandHeight = (max(ys) - self.minY) / numBands or 1.0
+        self.bands = [[] for _ in range(numBands)]
+        for a, b in edges:
+            first = self._band(min(a[1], b[1]))
+            last = self._band(max(a[1], b[1]))
+            for band in range(first, last + 1):
+                self.bands[band].append((a[0], a[1], b[0], b[1]))
+
+    # Returns the edges that might cross the band between two y values, as
+    # (x1, y1, x2, y2) tuples
+    def edgesBetween(self, y1, y2):
+        first = self._band(min(y1, y2))
+        last = self._band(max(y1, y2))
+        if first == last:
+            return self.bands[first]
+        edges = set()
+        for band in range(first, last + 1):
+            edges.update(self.bands[band])
+        return edges
+
+    def _band(self, y):
+        return min(len(self.bands) - 1, max(0, int((y - self.minY) / self.bandHeight)))
+
+    # Even-odd ray casting, so holes are handled. Points exactly on an edge may
+    # go either way.
+    def contains(self, x, y):
+        inside = False
+        for x1, y1, x2, y2 in self.bands[self._band(y)]:
+            if (y1 > y) != (y2 > y):
+                if x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+        return inside
+
+
+# Returns the parts of a LineString's coordinates inside any of the
+# PreparedPolygons, as a list of LineString coordinates
+def clipLine(coordinates, polygons):
+    pieces = []
+    current = []
+    for i in range(len(coordinates) - 1):
+        a, b = coordinates[i], coordinates[i + 1]
+
+        # Split the segment everywhere it crosses a polygon edge
+        splits = set([0.0, 1.0])
+        for polygon in polygons:
+            for edge in polygon.edgesBetween(a[1], b[1]):
+                t = segmentIntersection(a, b, edge)
+                if t is not None:
+                    splits.add(t)
+        splits = sorted(splits)
+
+        for t1, t2 in zip(splits, splits[1:]):
+            if t2 - t1 < 1e-12:
+                continue
+            middle = interpolate(a, b, (t1 + t2) / 2)
+            if any(polygon.contains(middle[0], middle[1]) for polygon in polygons):
+                start = interpolate(a, b, t1)
+                if not current:
+                    current.append(start)
+                current.append(interpolate(a, b, t2))
+            elif current:
+                pieces.append(current)
+                current = []
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+# Where along the segment from a to b does it cross an (x1, y1, x2, y2) edge?
+# Returns a fraction from 0 to 1, or None.
+def segmentIntersection(a, b, edge):
+    x1, y1, x2, y2 = edge
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    ex, ey = x2 - x1, y2 - y1
+    denominator = dx * ey - dy * ex
+    if denominator == 0:
+        return None
+    t = ((x1 - a[0]) * ey - (y1 - a[1]) * ex) / denominator
+    u = ((x1 - a[0]) * dy - (y1 - a[1]) * dx) / denominator
+    if 0 <= t <= 1 and 0 <= u <= 1:
+        return t
+    return None
+
+
+def interpolate(a, b, t):
+    if t == 0:
+        return [a[0], a[1]]
+    if t == 1:
+        return [b[0], b[1]]
+    return [
+        round(a[0] + (b[0] - a[0]) * t, 6),
+        round(a[1] + (b[1] - a[1]) * t, 6),
+    ]
+
+
+def bboxesOverlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def lineIntersectsPolygon(coordinates, polygon):
+    for pt in coordinates:
+        if polygon.contains(pt[0], pt[1]):
+            return True
+
+    # The line could pass through the polygon without a vertex inside it
+    for i in range(len(coordinates) - 1):
+        a, b = coordinates[i], coordinates[i + 1]
+        segmentBbox = (
+            min(a[0], b[0]),
+            min(a[1], b[1]),
+            max(a[0], b[0]),
+            max(a[1], b[1]),
+        )
+        for ring in polygon.rings:
+            for j in range(len(ring) - 1):
+                c, d = ring[j], ring[j + 1]
+                if (
+                    max(c[0], d[0]) < segmentBbox[0]
+                    or min(c[0], d[0]) > segmentBbox[2]
+                    or max(c[1], d[1]) < segmentBbox[1]
+                    or min(c[1], d[1]) > segmentBbox[3]
+                ):
+                    continue
+                if segmentsIntersect(a, b, c, d):
+                    return True
+    return False
+
+
+def segmentsIntersect(a, b, c, d):
+    d1 = cross(c, d, a)
+    d2 = cross(c, d, b)
+    d3 = cross(a, b, c)
+    d4 = cross(a, b, d)
+    if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and (
+        (d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)
+    ):
+        return True
+    # Touching or collinear cases
+    return (
+        (d1 == 0 and onSegment(c, d, a))
+        or (d2 == 0 and onSegment(c, d, b))
+        or (d3 == 0 and onSegment(a, b, c))
+        or (d4 == 0 and onSegment(a, b, d))
+    )
+
+
+# The z component of (b - a) x (p - a)
+def cross(a, b, p):
+    return (b[0] - a[0]) * (p[1] - a[1]) - (b[1] - a[1]) * (p[0] - a[0])
+
+
+# Assuming p is collinear with a and b, is it between them?
+def onSegment(a, b, p):
+    return min(a[0], b[0]) <= p[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= p[
+        1
+    ] <= max(a[1], b[1])
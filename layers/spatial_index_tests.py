@@ -0,0 +1,97 @@
+import unittest
+
+from spatial_index import PreparedPolygon, SpatialIndex, clipLine
+
+
+def square(x1, y1, x2, y2):
+    return [[[x1, y1], [x2, y1], [x2, y2], [x1, y2], [x1, y1]]]
+
+
+class TestSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        # Two adjacent LADs inside one TA. The first LAD has a hole.
+        self.index = SpatialIndex(
+            [
+                {
+                    "type": "Feature",
+                    "properties": {"name": "West", "level": "LAD"},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": square(0, 0, 1, 1) + square(0.4, 0.4, 0.6, 0.6),
+                    },
+                },
+                {
+                    "type": "Feature",
+                    "properties": {"name": "East", "level": "LAD"},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": square(1, 0, 2, 1),
+                    },
+                },
+                {
+                    "type": "Feature",
+                    "properties": {"name": "Both", "level": "TA"},
+                    "geometry": {
+                        "type": "MultiPolygon",
+                        "coordinates": [square(0, 0, 2, 1)],
+                    },
+                },
+            ],
+            cellSize=0.25,
+        )
+
+    def test_lookupPoint(self):
+        self.assertEqual(self.index.lookupPoint(0.2, 0.2), [0, 2])
+        self.assertEqual(self.index.lookupPoint(1.5, 0.5), [1, 2])
+        # In the hole
+        self.assertEqual(self.index.lookupPoint(0.5, 0.5), [2])
+        self.assertEqual(self.index.lookupPoint(3, 3), [])
+
+    def test_lookupLine(self):
+        # No vertex is inside any polygon, but the line crosses all of them
+        self.assertEqual(self.index.lookupLine([[-1, 0.2], [3, 0.2]]), [0, 1, 2])
+        self.assertEqual(self.index.lookupLine([[-1, 2], [3, 2]]), [])
+
+    def test_tagFeature(self):
+        feature = {
+            "type": "Feature",
+            "properties": {},
+            "geometry": {"type": "LineString", "coordinates": [[0.8, 0.8], [1.2, 0.8]]},
+        }
+        self.index.tagFeature(feature)
+        self.assertEqual(feature["properties"], {"LAD": "West;East", "TA": "Both"})
+
+
+class TestClipLine(unittest.TestCase):
+    def setUp(self):
+        # A square with a hole in the middle
+        self.polygons = [
+            PreparedPolygon(square(0, 0, 4, 4) + square(1.5, 1.5, 2.5, 2.5))
+        ]
+
+    def test_crossing_edge(self):
+        self.assertEqual(
+            clipLine([[-1, 1], [1, 1]], self.polygons), [[[0.0, 1.0], [1, 1]]]
+        )
+        # In, out, and back in again
+        self.assertEqual(
+            clipLine([[1, -1], [1, 1], [5, 1], [5, 3], [3, 3]], self.polygons),
+            [[[1.0, 0.0], [1, 1], [4.0, 1.0]], [[4.0, 3.0], [3, 3]]],
+        )
+
+    def test_inside_and_outside(self):
+        self.assertEqual(
+            clipLine([[0.5, 0.5], [1, 1], [3, 1]], self.polygons),
+            [[[0.5, 0.5], [1, 1], [3, 1]]],
+        )
+        self.assertEqual(clipLine([[5, 5], [6, 6]], self.polygons), [])
+
+    def test_through_hole(self):
+        self.assertEqual(
+            clipLine([[1, 2], [3, 2]], self.polygons),
+            [[[1, 2], [1.5, 2.0]], [[2.5, 2.0], [3, 2]]],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
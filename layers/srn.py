@@ -4,8 +4,7 @@ from utils import *
 
 
 def makeSRN():
-    tmp = "tmp_srn"
-    ensureEmptyTempDirectoryExists(tmp)
+    tmp = ensureEmptyTempDirectoryExists("tmp_srn", estimatedBytes=4 * GB)
 
     run(
         [
@@ -18,19 +17,14 @@ def makeSRN():
     )
     run(["unzip", f"{tmp}/oproad_gpkg_gb.zip", "-d", tmp])
 
-    # Convert to GeoJSON, projecting to WGS84. Select only trunk roads (the SRN).
-    run(
-        [
-            "ogr2ogr",
-            "-f",
-            "GeoJSON",
-            f"{tmp}/srn.geojson",
-            "-t_srs",
-            "EPSG:4326",
-            f"{tmp}/Data/oproad_gb.gpkg",
-            "-sql",
-            "SELECT name_1 as name, geometry FROM road_link WHERE trunk_road",
-        ]
+    # Convert to GeoJSON, projecting to WGS84. Select only trunk roads (the SRN)
+    # in England.
+    reprojectToWgs84(
+        f"{tmp}/Data/oproad_gb.gpkg",
+        f"{tmp}/srn.geojson",
+        sql="SELECT name_1 as name, geometry FROM road_link WHERE trunk_road",
+        clipToEngland=True,
+        precision=6,
     )
 
     convertGeoJsonToPmtiles(
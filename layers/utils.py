@@ -1,17 +1,114 @@
+import gzip
+import hashlib
 import json
+import math
 import os
+import shutil
 import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+GB = 1024**3
 
-def run(args):
+# A rough [min lon, min lat, max lon, max lat] around England
+ENGLAND_BBOX = [-6.5, 49.8, 1.8, 55.9]
+
+
+def run(args, cwd=None):
     print(">", " ".join(args))
-    subprocess.run(args, check=True)
+    subprocess.run(args, check=True, cwd=cwd)
+
+
+# Manages the temporary directories layers write intermediate files to. All of
+# them live under one configurable root, so a fast local disk or a tmpfs can be
+# used. When a layer finishes, the bytes it wrote are recorded and its
+# directories are deleted, unless keepTmp is set.
+class ScratchSpace:
+    def __init__(self, root=".", keepTmp=False):
+        self.root = root
+        self.keepTmp = keepTmp
+        # Directories created by the layer currently running
+        self.directories = []
+        # Layer name to bytes of scratch space used
+        self.usage = {}
+        # Output layer name to the path of its final GeoJSON, for the layer
+        # currently running. Optional stages read these before the files are
+        # deleted.
+        self.cleanedLayers = {}
+
+    def configure(self, root, keepTmp):
+        self.root = root
+        self.keepTmp = keepTmp
+        os.makedirs(root, exist_ok=True)
+
+    # Returns the path to an empty directory, after checking that
+    # estimatedBytes will fit on the disk
+    def makeDirectory(self, directoryName, estimatedBytes=0):
+        path = os.path.join(self.root, directoryName)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+        free = shutil.disk_usage(self.root).free
+        if estimatedBytes > free:
+            raise Exception(
+                f"{directoryName} needs about {formatBytes(estimatedBytes)} of scratch space, but only {formatBytes(free)} is free in {self.root}. Use --tmp_root to pick somewhere else."
+            )
+
+        os.makedirs(path)
+        self.directories.append(path)
+        return path
+
+    # Call after each layer is done. Records how much space the layer used, then
+    # deletes its directories.
+    def finishLayer(self, layerName):
+        used = sum(directorySize(path) for path in self.directories)
+        self.usage[layerName] = self.usage.get(layerName, 0) + used
+        print(f"{layerName} used {formatBytes(used)} of scratch space")
+
+        if not self.keepTmp:
+            for path in self.directories:
+                print(f"Removing {path}")
+                shutil.rmtree(path, ignore_errors=True)
+        self.directories = []
+        self.cleanedLayers = {}
+
+    def printSummary(self):
+        for layerName, used in self.usage.items():
+            print(f"  {layerName}: {formatBytes(used)}")
+        print(f"  Total: {formatBytes(sum(self.usage.values()))}")
+
+
+scratch = ScratchSpace()
+
+
+# Returns the path to an empty temporary directory under the scratch root
+def ensureEmptyTempDirectoryExists(directoryName, estimatedBytes=0):
+    return scratch.makeDirectory(directoryName, estimatedBytes)
 
 
-def ensureEmptyTempDirectoryExists(directoryName):
-    if os.path.isdir(directoryName):
-        run(["rm", "-r", directoryName])
-    os.makedirs(directoryName, exist_ok=True)
+# Records the final GeoJSON that an output layer was made from.
+# convertGeoJsonToPmtiles calls this; layers producing GeoJSON directly should
+# call it themselves.
+def registerCleanedLayer(layerName, geojsonPath):
+    scratch.cleanedLayers[layerName] = geojsonPath
+
+
+def directorySize(path):
+    total = 0
+    for dirPath, _, filenames in os.walk(path):
+        for filename in filenames:
+            filePath = os.path.join(dirPath, filename)
+            if not os.path.islink(filePath):
+                total += os.path.getsize(filePath)
+    return total
+
+
+def formatBytes(numBytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if numBytes < 1024:
+            return f"{numBytes:.1f}{unit}"
+        numBytes /= 1024
+    return f"{numBytes:.1f}TB"
 
 
 def convertPbfToGeoJson(pbfPath, geojsonPath, geometryType, includeOsmID=False):
@@ -37,28 +134,187 @@ def convertPbfToGeoJson(pbfPath, geojsonPath, geometryType, includeOsmID=False):
 
 # Note the layer name is based on the output filename. This always generates
 # numeric feature IDs. For autoZoom, see https://github.com/felt/tippecanoe docs about -zg.
-def convertGeoJsonToPmtiles(geojsonPath, pmtilesPath, autoZoom=False, args=[]):
+#
+# tippecanoe records its command line in the PMTiles metadata. To keep the
+# output identical across runs no matter where scratch space is, it runs next
+# to the input with relative paths, and the result is moved into place.
+#
+# parallelInput makes tippecanoe read the input with multiple threads. This only
+# works for GeoJSONSeq, with one feature per line.
+#
+# importance takes a feature and returns a number (or anything comparable),
+# with bigger meaning more important. When it's given, features are ranked by
+# rankFeatures, so the least important ones are left out of low zoom tiles,
+# instead of whichever tippecanoe happens to drop. tippecanoe reads a ranked
+# copy, so the registered GeoJSON stays free of tippecanoe-only members. No
+# feature is ranked past the maximum zoom tippecanoe uses, and with autoZoom,
+# the guessed maximum zoom is at least rankMaxZoom.
+def convertGeoJsonToPmtiles(
+    geojsonPath,
+    pmtilesPath,
+    autoZoom=False,
+    args=[],
+    parallelInput=False,
+    importance=None,
+):
     layerName = os.path.basename(pmtilesPath)[: -len(".pmtiles")]
     zoom = []
     if autoZoom:
         zoom = ["-zg"]
+    parallel = []
+    if parallelInput:
+        parallel = ["-P"]
+    registerCleanedLayer(layerName, geojsonPath)
+    inputPath = geojsonPath
+    if importance:
+        maxZoom = rankMaxZoom
+        if maximumZoom(args) is not None:
+            maxZoom = min(maxZoom, maximumZoom(args))
+        inputPath = rankFeatures(geojsonPath, importance, maxZoom=maxZoom)
+        # Don't also drop points at random below the maximum zoom
+        zoom.append("-r1")
+        if autoZoom:
+            zoom.append(f"--smallest-maximum-zoom-guess={maxZoom}")
+    inputDirectory = os.path.dirname(geojsonPath) or "."
     run(
         [
             "tippecanoe",
-            geojsonPath,
+            os.path.basename(inputPath),
             "--generate-ids",
             "-l",
             layerName,
             "-o",
-            pmtilesPath,
+            f"{layerName}.pmtiles",
+            "--force",
         ]
         + zoom
-        + args
+        + parallel
+        + args,
+        cwd=inputDirectory,
+    )
+    shutil.move(os.path.join(inputDirectory, f"{layerName}.pmtiles"), pmtilesPath)
+    if inputPath != geojsonPath:
+        os.remove(inputPath)
+
+
+# The highest zoom that features are ranked up to
+rankMaxZoom = 10
+
+
+# The maximum zoom set in tippecanoe arguments, or None if they don't set one
+def maximumZoom(args):
+    for arg in args:
+        for prefix in ["--maximum-zoom=", "-z"]:
+            if arg.startswith(prefix) and arg[len(prefix) :].isdigit():
+                return int(arg[len(prefix) :])
+    return None
+
+
+# Writes a copy of a GeoJSON or GeoJSONSeq file next to it, in the same format,
+# giving every feature a tippecanoe minzoom, and returns its path. Going through
+# features from most to least important, each one appears from the lowest zoom
+# where the tile containing it (judged by its first point) has fewer than
+# featuresPerTile features so far, or else from maxZoom. Features with equal
+# importance keep their input order. The feature order in the file is
+# unchanged, so this only needs the scores and tiles in memory.
+def rankFeatures(path, importance, featuresPerTile=2000, maxZoom=rankMaxZoom):
+    print(f"Ranking features in {path}")
+    scores = []
+    tiles = []
+    for feature in readFeatures(path):
+        scores.append(importance(feature))
+        tiles.append(tileContaining(firstPoint(feature["geometry"]), maxZoom))
+
+    minZooms = [maxZoom] * len(scores)
+    counts = defaultdict(int)
+    for idx in sorted(range(len(scores)), key=lambda idx: scores[idx], reverse=True):
+        x, y = tiles[idx]
+        for z in range(maxZoom + 1):
+            if counts[(z, x >> (maxZoom - z), y >> (maxZoom - z))] < featuresPerTile:
+                minZooms[idx] = z
+                break
+        for z in range(minZooms[idx], maxZoom + 1):
+            counts[(z, x >> (maxZoom - z), y >> (maxZoom - z))] += 1
+
+    def features():
+        for idx, feature in enumerate(readFeatures(path)):
+            feature["tippecanoe"] = {"minzoom": minZooms[idx]}
+            yield feature
+
+    base, extension = os.path.splitext(path)
+    rankedPath = f"{base}_ranked{extension}"
+    if extension == ".geojsonl":
+        with open(rankedPath, "w") as f:
+            for feature in features():
+                f.write(json.dumps(feature))
+                f.write("\n")
+    else:
+        writeFeatureCollection(rankedPath, features())
+
+    perZoom = [minZooms.count(z) for z in range(maxZoom + 1)]
+    print(f"Features first appearing at zooms 0 to {maxZoom}: {perZoom}")
+    return rankedPath
+
+
+def firstPoint(geometry):
+    coordinates = geometry["coordinates"]
+    while isinstance(coordinates[0], list):
+        coordinates = coordinates[0]
+    return coordinates
+
+
+# The x and y of the web mercator tile containing a WGS84 point
+def tileContaining(pt, zoom):
+    n = 2**zoom
+    lat = math.radians(max(-85.0511, min(85.0511, pt[1])))
+    x = math.floor((pt[0] + 180) / 360 * n)
+    y = math.floor((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)
+    return (min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+
+
+# Writes a GeoJSON or GeoJSONSeq file as FlatGeobuf, with a packed Hilbert
+# R-tree, so features in a bounding box can be read with a few HTTP range
+# requests
+def convertGeoJsonToFlatGeobuf(geojsonPath, fgbPath, layerName):
+    # ogr2ogr won't replace an existing file
+    if os.path.exists(fgbPath):
+        os.remove(fgbPath)
+    run(
+        [
+            "ogr2ogr",
+            "-f",
+            "FlatGeobuf",
+            fgbPath,
+            geojsonPath,
+            "-nln",
+            layerName,
+            "-lco",
+            "SPATIAL_INDEX=YES",
+        ]
     )
 
 
-# Produces GeoJSON output
-def reprojectToWgs84(inputPath, outputPath):
+# Produces GeoJSON output. To avoid another pass over the output in Python,
+# ogr2ogr can also:
+#
+# - only keep some columns, or run some SQL instead
+# - only keep features intersecting a rough bounding box of England
+# - round coordinates to some number of decimal places. If this is used, pass
+#   trimCoordinates=False to cleanUpGeojson.
+def reprojectToWgs84(
+    inputPath, outputPath, columns=None, sql=None, clipToEngland=False, precision=None
+):
+    args = []
+    if columns:
+        args.extend(["-select", ",".join(columns)])
+    if sql:
+        args.extend(["-sql", sql])
+    if clipToEngland:
+        args.extend(["-spat"] + [str(x) for x in ENGLAND_BBOX])
+        args.extend(["-spat_srs", "EPSG:4326"])
+    if precision is not None:
+        args.extend(["-lco", f"COORDINATE_PRECISION={precision}"])
+
     run(
         [
             "ogr2ogr",
@@ -68,7 +324,10 @@ def reprojectToWgs84(inputPath, outputPath):
             "-t_srs",
             "EPSG:4326",
             inputPath,
+            "-lco",
+            "WRITE_NAME=NO",
         ]
+        + args
     )
 
 
@@ -77,36 +336,85 @@ def reprojectToWgs84(inputPath, outputPath):
 # - Removes redundant top-level attributes set by ogr2ogr
 # - Filters features using filterFeatures
 # - Adds a numeric ID to every feature
-# - Trims coordinate precision
+# - Trims coordinate precision, unless trimCoordinates is False
 # - Uses the transformProperties callback to transform each feature's
 #   properties. The callback takes input properties and should return output
 #   properties.
-def cleanUpGeojson(path, transformProperties, filterFeatures=lambda f: True):
+# - If a SpatialIndex of authorities is passed in, adds the authorities each
+#   feature is in as properties
+def cleanUpGeojson(
+    path,
+    transformProperties,
+    filterFeatures=lambda f: True,
+    authorities=None,
+    trimCoordinates=True,
+):
     print(f"Cleaning up {path}")
-    gj = {}
+    # Unnecessary top-level attributes present in some files, like name and crs,
+    # are dropped
+    features = []
     with open(path) as f:
-        gj = json.load(f)
-
-        # Remove unnecessary attributes present in some files
-        for key in ["name", "crs"]:
-            if key in gj:
-                del gj[key]
-
-        gj["features"] = list(filter(filterFeatures, gj["features"]))
+        features = list(filter(filterFeatures, json.load(f)["features"]))
 
         counter = 1
-        for feature in gj["features"]:
+        for feature in features:
             feature["properties"] = transformProperties(feature["properties"])
 
-            feature["geometry"]["coordinates"] = trimPrecision(
-                feature["geometry"]["coordinates"]
-            )
+            if trimCoordinates:
+                feature["geometry"]["coordinates"] = trimPrecision(
+                    feature["geometry"]["coordinates"]
+                )
+
+            if authorities:
+                authorities.tagFeature(feature)
 
             # The frontend needs IDs for hovering
             feature["id"] = counter
             counter += 1
+    writeFeatureCollection(path, features)
+
+
+# Writes a GeoJSON FeatureCollection with one feature per line, so
+# readFeatures can stream it back
+def writeFeatureCollection(path, features):
     with open(path, "w") as f:
-        f.write(json.dumps(gj))
+        f.write('{"type":"FeatureCollection","features":[\n')
+        first = True
+        for feature in features:
+            if not first:
+                f.write(",\n")
+            f.write(json.dumps(feature))
+            first = False
+        f.write("\n]}\n")
+
+
+# Yields every feature from a GeoJSON file. Files written by
+# writeFeatureCollection and GeoJSONSeq files are streamed one line at a time,
+# so they never have to fit in memory. Anything else is loaded all at once.
+def readFeatures(path):
+    with open(path) as f:
+        header = f.readline()
+        if header == '{"type":"FeatureCollection","features":[\n':
+            for line in f:
+                line = line.rstrip().rstrip(",")
+                if line and line != "]}":
+                    yield json.loads(line)
+            return
+
+        try:
+            first = json.loads(header.strip("\x1e"))
+        except json.JSONDecodeError:
+            first = None
+        if first and first.get("type") == "Feature":
+            yield first
+            for line in f:
+                line = line.strip("\x1e\n ")
+                if line:
+                    yield json.loads(line)
+            return
+
+    with open(path) as f:
+        yield from json.load(f)["features"]
 
 
 # Round coordinates to 6 decimal places. Takes feature.geometry.coordinates,
@@ -120,6 +428,63 @@ def trimPrecision(data):
         raise Exception(f"Unexpected data within coordinates: {data}")
 
 
+# Writes a Point for every Polygon or MultiPolygon feature in a GeoJSON file,
+# keeping properties and IDs. Used to show polygon layers at low zooms.
+def writePointLayer(polygonPath, pointPath):
+    def features():
+        for feature in readFeatures(polygonPath):
+            point = dict(feature)
+            point["geometry"] = {
+                "type": "Point",
+                "coordinates": interiorPoint(feature["geometry"]),
+            }
+            yield point
+
+    writeFeatureCollection(pointPath, features())
+
+
+# Returns a point guaranteed to be inside a Polygon or MultiPolygon (unlike the
+# centroid), for labels and markers. A horizontal line through the middle of
+# the largest polygon is cut by every ring, and the middle of the widest part
+# inside is used.
+def interiorPoint(geometry):
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise Exception(f"Can't find an interior point of {geometry['type']}")
+
+    def outerArea(polygon):
+        ring = polygon[0]
+        return abs(sum(a[0] * b[1] - b[0] * a[1] for a, b in zip(ring, ring[1:])) / 2)
+
+    polygon = max(polygons, key=outerArea)
+
+    # Don't put the line exactly through a vertex. Use halfway between the two
+    # vertex heights closest to the middle.
+    ys = sorted(set(pt[1] for pt in polygon[0]))
+    middle = (ys[0] + ys[-1]) / 2
+    above = min((y for y in ys if y > middle), default=ys[-1])
+    below = max((y for y in ys if y <= middle), default=ys[0])
+    y = (above + below) / 2
+
+    crossings = []
+    for ring in polygon:
+        for a, b in zip(ring, ring[1:]):
+            if (a[1] > y) != (b[1] > y):
+                crossings.append(a[0] + (y - a[1]) * (b[0] - a[0]) / (b[1] - a[1]))
+    crossings.sort()
+
+    if len(crossings) < 2:
+        # A degenerate polygon
+        return [round(polygon[0][0][0], 6), round(polygon[0][0][1], 6)]
+    x1, x2 = max(
+        zip(crossings[::2], crossings[1::2]), key=lambda pair: pair[1] - pair[0]
+    )
+    return [round((x1 + x2) / 2, 6), round(y, 6)]
+
+
 # Modifies a GeoJSON file in-place, removing any holes from polygons.
 def removePolygonHoles(path):
     gj = {}
@@ -133,3 +498,348 @@ def removePolygonHoles(path):
             del feature["geometry"]["coordinates"][1:]
     with open(path, "w") as f:
         f.write(json.dumps(gj))
+
+
+def hashFile(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+# Outputs served as whole files, worth compressing ahead of time. PMTiles and
+# FlatGeobuf are read with range requests, so they're left alone.
+compressibleExtensions = [".geojson", ".geojsonl", ".json", ".topojson"]
+
+# The Content-Encoding to upload each compressed variant with
+contentEncodings = {".gz": "gzip", ".br": "br"}
+
+
+# Writes a .gz copy, and with useBrotli a .br copy, of every compressible file
+# in directory, using the highest compression levels, because files are
+# compressed once and downloaded many times. Files are compressed in parallel.
+# Copies newer than their original are kept. The manifest and any paths in
+# ignore, like the same list given to writeOutputManifest, are skipped.
+def compressOutputs(directory, manifestPath, useBrotli=False, ignore=[]):
+    skip = set(os.path.abspath(path) for path in [manifestPath] + ignore)
+    jobs = []
+    for dirPath, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            path = os.path.join(dirPath, filename)
+            if os.path.splitext(filename)[1] not in compressibleExtensions:
+                continue
+            if os.path.abspath(path) in skip:
+                continue
+            jobs.append((path, ".gz"))
+            if useBrotli:
+                jobs.append((path, ".br"))
+
+    def compress(job):
+        path, extension = job
+        compressedPath = path + extension
+        if os.path.exists(compressedPath) and os.path.getmtime(
+            compressedPath
+        ) >= os.path.getmtime(path):
+            return
+        if extension == ".gz":
+            # Leave out the filename and modification time, so the output is
+            # the same every time
+            with open(path, "rb") as input, open(compressedPath, "wb") as output:
+                with gzip.GzipFile(
+                    filename="", mode="wb", fileobj=output, compresslevel=9, mtime=0
+                ) as f:
+                    shutil.copyfileobj(input, f)
+        else:
+            run(["brotli", "--quality=11", "--force", "-o", compressedPath, path])
+
+    with ThreadPoolExecutor() as pool:
+        for _ in pool.map(compress, jobs):
+            pass
+
+
+# Records the size and SHA-256 of every file in directory (besides the manifest
+# itself and any paths in ignore, or compressed copies of them). Compressed
+# copies also record their Content-Encoding and original file.
+#
+# previousManifestPath should be the manifest of what was last uploaded. Returns
+# the relative paths of new or changed files, which need to be uploaded again,
+# and of removed files. If there's no previous manifest, everything is new.
+def writeOutputManifest(directory, manifestPath, previousManifestPath, ignore=[]):
+    previous = {}
+    if previousManifestPath and os.path.exists(previousManifestPath):
+        with open(previousManifestPath) as f:
+            previous = json.load(f)
+
+    skip = set(os.path.abspath(path) for path in [manifestPath] + ignore)
+    manifest = {}
+    for dirPath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirPath, filename)
+            original, extension = os.path.splitext(path)
+            if os.path.abspath(path) in skip or (
+                extension in contentEncodings and os.path.abspath(original) in skip
+            ):
+                continue
+            manifest[os.path.relpath(path, directory)] = {
+                "size": os.path.getsize(path),
+                "sha256": hashFile(path),
+            }
+
+    # Compressed copies from compressOutputs say how to upload them
+    for name, entry in manifest.items():
+        original, extension = os.path.splitext(name)
+        if extension in contentEncodings and original in manifest:
+            entry["content_encoding"] = contentEncodings[extension]
+            entry["original"] = original
+            entry["original_size"] = manifest[original]["size"]
+
+    changed = []
+    for name, entry in sorted(manifest.items()):
+        if name not in previous:
+            print(f"New: {name}")
+            changed.append(name)
+        elif previous[name]["sha256"] != entry["sha256"]:
+            print(f"Changed: {name}")
+            changed.append(name)
+    removed = []
+    for name in sorted(previous):
+        if name not in manifest:
+            print(f"Removed: {name}")
+            removed.append(name)
+
+    with open(manifestPath, "w") as f:
+        f.write(json.dumps(manifest, indent=2, sort_keys=True))
+    return changed, removed
+
+
+# Splits polygon rings into arcs, like TopoJSON does, so edges shared between
+# neighbouring polygons are only stored once. A ring is cut wherever it meets
+# another ring with different neighbouring points.
+#
+# Takes a list of Polygon or MultiPolygon GeoJSON geometries. Returns a list of
+# arcs, each a list of (x, y) tuples, and the coordinates of each geometry with
+# every ring replaced by a list of arc indices. A negative index ~i means arc i
+# reversed.
+def buildArcs(geometries):
+    polygonsPerGeometry = []
+    rings = []
+    for geometry in geometries:
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            raise Exception(f"Can't build arcs for {geometry['type']}")
+
+        ringIndices = []
+        for polygon in polygons:
+            ringIndices.append([])
+            for ring in polygon:
+                points = []
+                for pt in ring:
+                    pt = (pt[0], pt[1])
+                    if not points or points[-1] != pt:
+                        points.append(pt)
+                # Arcs are built from the ring without its closing point
+                if len(points) > 1 and points[0] == points[-1]:
+                    points.pop()
+                ringIndices[-1].append(len(rings))
+                rings.append(points)
+        polygonsPerGeometry.append(ringIndices)
+
+    # A point is a junction if rings pass through it with different neighbours
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        for i, pt in enumerate(ring):
+            pair = tuple(sorted([ring[i - 1], ring[(i + 1) % len(ring)]]))
+            if neighbours.setdefault(pt, pair) != pair:
+                junctions.add(pt)
+
+    arcs = []
+    arcIndex = {}
+
+    def addArc(points):
+        key = tuple(points)
+        if key in arcIndex:
+            return arcIndex[key]
+        reversedKey = tuple(reversed(points))
+        if reversedKey in arcIndex:
+            return ~arcIndex[reversedKey]
+        arcIndex[key] = len(arcs)
+        arcs.append(points)
+        return arcIndex[key]
+
+    ringArcs = []
+    for ring in rings:
+        cuts = [i for i, pt in enumerate(ring) if pt in junctions]
+        if not cuts:
+            # The whole ring is one closed arc. Start from the smallest point,
+            # so identical rings match.
+            start = ring.index(min(ring))
+            rotated = ring[start:] + ring[:start]
+            ringArcs.append([addArc(rotated + [rotated[0]])])
+            continue
+
+        refs = []
+        for j, cut in enumerate(cuts):
+            end = cuts[j + 1] if j + 1 < len(cuts) else cuts[0] + len(ring)
+            refs.append(addArc([ring[k % len(ring)] for k in range(cut, end + 1)]))
+        ringArcs.append(refs)
+
+    topology = []
+    for geometry, ringIndices in zip(geometries, polygonsPerGeometry):
+        polygons = [[ringArcs[ring] for ring in polygon] for polygon in ringIndices]
+        topology.append(polygons[0] if geometry["type"] == "Polygon" else polygons)
+    return arcs, topology
+
+
+# Turns a list of arc indices from buildArcs back into a closed ring of [x, y]
+# coordinates
+def ringFromArcs(arcs, refs):
+    ring = []
+    for ref in refs:
+        points = arcs[ref] if ref >= 0 else list(reversed(arcs[~ref]))
+        if ring:
+            points = points[1:]
+        ring.extend([pt[0], pt[1]] for pt in points)
+    return ring
+
+
+# Writes a GeoJSON file of Polygons, MultiPolygons, and Points as TopoJSON
+# (https://github.com/topojson/topojson-specification). Edges shared by
+# neighbouring polygons are stored once as arcs, and coordinates are quantized
+# to integers on a quantization x quantization grid over the bounding box. Arc
+# points are delta-encoded, so most are small numbers. The result has one
+# object named layerName, which topojson-client's feature(topology,
+# topology.objects[layerName]) or readTopoJson turns back into GeoJSON.
+def writeTopoJson(geojsonPath, topojsonPath, layerName, quantization=100000):
+    features = list(readFeatures(geojsonPath))
+    xs = []
+    ys = []
+    for feature in features:
+        coordinates = feature["geometry"]["coordinates"]
+        if not isinstance(coordinates[0], list):
+            # A Point
+            coordinates = [coordinates]
+        # Flatten rings and polygons down to a list of positions
+        while isinstance(coordinates[0][0], list):
+            coordinates = [pt for part in coordinates for pt in part]
+        xs.extend(pt[0] for pt in coordinates)
+        ys.extend(pt[1] for pt in coordinates)
+    bbox = [min(xs), min(ys), max(xs), max(ys)]
+    scale = [
+        (bbox[2] - bbox[0]) / (quantization - 1) or 1,
+        (bbox[3] - bbox[1]) / (quantization - 1) or 1,
+    ]
+
+    def quantize(pt):
+        return [
+            round((pt[0] - bbox[0]) / scale[0]),
+            round((pt[1] - bbox[1]) / scale[1]),
+        ]
+
+    polygonal = [
+        f["geometry"]
+        for f in features
+        if f["geometry"]["type"] in ["Polygon", "MultiPolygon"]
+    ]
+    arcs, topology = buildArcs(polygonal)
+    topology = iter(topology)
+
+    encodedArcs = []
+    for arc in arcs:
+        points = []
+        for pt in map(quantize, arc):
+            # Nearby points can round to the same place. Always keep both ends.
+            if points and points[-1] == pt:
+                continue
+            points.append(pt)
+        if len(points) == 1:
+            points.append(points[0])
+        encoded = [points[0]]
+        for a, b in zip(points, points[1:]):
+            encoded.append([b[0] - a[0], b[1] - a[1]])
+        encodedArcs.append(encoded)
+
+    geometries = []
+    for feature in features:
+        geometry = feature["geometry"]
+        if geometry["type"] in ["Polygon", "MultiPolygon"]:
+            encoded = {"type": geometry["type"], "arcs": next(topology)}
+        elif geometry["type"] == "Point":
+            encoded = {
+                "type": "Point",
+                "coordinates": quantize(geometry["coordinates"]),
+            }
+        else:
+            raise Exception(f"Can't write {geometry['type']} to TopoJSON")
+        if "id" in feature:
+            encoded["id"] = feature["id"]
+        encoded["properties"] = feature["properties"]
+        geometries.append(encoded)
+
+    with open(topojsonPath, "w") as f:
+        f.write(
+            json.dumps(
+                {
+                    "type": "Topology",
+                    "bbox": bbox,
+                    "transform": {"scale": scale, "translate": bbox[:2]},
+                    "objects": {
+                        layerName: {
+                            "type": "GeometryCollection",
+                            "geometries": geometries,
+                        }
+                    },
+                    "arcs": encodedArcs,
+                },
+                separators=(",", ":"),
+            )
+        )
+
+
+# Returns the GeoJSON features of one object in a TopoJSON file from
+# writeTopoJson. Coordinates are only as precise as the quantization.
+def readTopoJson(topojsonPath, layerName):
+    with open(topojsonPath) as f:
+        topology = json.load(f)
+    scale = topology["transform"]["scale"]
+    translate = topology["transform"]["translate"]
+
+    def unquantize(pt):
+        return [pt[0] * scale[0] + translate[0], pt[1] * scale[1] + translate[1]]
+
+    arcs = []
+    for encoded in topology["arcs"]:
+        x, y = 0, 0
+        arc = []
+        for dx, dy in encoded:
+            x += dx
+            y += dy
+            arc.append((x, y))
+        arcs.append(arc)
+
+    def ring(refs):
+        return [unquantize(pt) for pt in ringFromArcs(arcs, refs)]
+
+    features = []
+    for geometry in topology["objects"][layerName]["geometries"]:
+        if geometry["type"] == "Polygon":
+            coordinates = [ring(refs) for refs in geometry["arcs"]]
+        elif geometry["type"] == "MultiPolygon":
+            coordinates = [
+                [ring(refs) for refs in polygon] for polygon in geometry["arcs"]
+            ]
+        else:
+            coordinates = unquantize(geometry["coordinates"])
+        feature = {
+            "type": "Feature",
+            "properties": geometry["properties"],
+            "geometry": {"type": geometry["type"], "coordinates": coordinates},
+        }
+        if "id" in geometry:
+            feature["id"] = geometry["id"]
+        features.append(feature)
+    return features
@@ -0,0 +1,367 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import unittest.mock
+
+import utils
+from utils import (
+    compressOutputs,
+    convertGeoJsonToPmtiles,
+    interiorPoint,
+    rankFeatures,
+    readFeatures,
+    readTopoJson,
+    writeFeatureCollection,
+    writeOutputManifest,
+    writeTopoJson,
+)
+
+
+def square(x1, y1, x2, y2):
+    return [[x1, y1], [x2, y1], [x2, y2], [x1, y2], [x1, y1]]
+
+
+class TestTopoJson(unittest.TestCase):
+    # Returns the features read back and the raw topology
+    def roundtrip(self, features, quantization):
+        with tempfile.TemporaryDirectory() as tmp:
+            geojsonPath = os.path.join(tmp, "input.geojson")
+            topojsonPath = os.path.join(tmp, "output.topojson")
+            writeFeatureCollection(geojsonPath, features)
+            writeTopoJson(geojsonPath, topojsonPath, "areas", quantization)
+            with open(topojsonPath) as f:
+                topology = json.load(f)
+            return readTopoJson(topojsonPath, "areas"), topology
+
+    # Rings may start at a different point, and coordinates are quantized
+    def assertSameFeatures(self, result, features):
+        def normalize(data):
+            if isinstance(data[0], list) and not isinstance(data[0][0], list):
+                ring = [[round(x, 6) for x in pt] for pt in data[:-1]]
+                start = ring.index(min(ring))
+                return ring[start:] + ring[:start]
+            if isinstance(data[0], list):
+                return [normalize(x) for x in data]
+            return [round(x, 6) for x in data]
+
+        for feature in result + features:
+            feature["geometry"]["coordinates"] = normalize(
+                feature["geometry"]["coordinates"]
+            )
+        self.assertEqual(result, features)
+
+    def test_roundtrip(self):
+        features = [
+            {
+                "type": "Feature",
+                "id": 1,
+                "properties": {"name": "West"},
+                "geometry": {"type": "Polygon", "coordinates": [square(0, 0, 1, 1)]},
+            },
+            {
+                "type": "Feature",
+                "id": 2,
+                "properties": {"name": "East"},
+                "geometry": {
+                    "type": "MultiPolygon",
+                    "coordinates": [[square(1, 0, 2, 1)], [square(3, 0, 4, 0.5)]],
+                },
+            },
+            {
+                "type": "Feature",
+                "id": 3,
+                "properties": {"name": "Station"},
+                "geometry": {"type": "Point", "coordinates": [0.5, 0.25]},
+            },
+        ]
+        result, topology = self.roundtrip(features, quantization=1001)
+        self.assertEqual(topology["bbox"], [0, 0, 4, 1])
+        self.assertSameFeatures(result, features)
+
+    def test_single_polygon(self):
+        # Every vertex, not just the first, decides the bounding box
+        ring = [[-1.5, 52], [-1, 52], [-1, 52.5], [-1.25, 53], [-1.5, 52]]
+        features = [
+            {
+                "type": "Feature",
+                "id": 1,
+                "properties": {},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            }
+        ]
+        result, topology = self.roundtrip(features, quantization=101)
+        self.assertEqual(topology["bbox"], [-1.5, 52, -1, 53])
+        self.assertEqual(topology["transform"]["scale"], [0.005, 0.01])
+
+        # Every decoded position is on the quantized grid
+        for arc in topology["arcs"]:
+            x, y = 0, 0
+            for dx, dy in arc:
+                x, y = x + dx, y + dy
+                self.assertTrue(0 <= x <= 100 and 0 <= y <= 100)
+        self.assertSameFeatures(result, features)
+
+
+class TestInteriorPoint(unittest.TestCase):
+    def test_interiorPoint(self):
+        # The centroid of a U shape is outside it
+        u = [[0, 0], [3, 0], [3, 3], [2, 3], [2, 1], [1, 1], [1, 3], [0, 3], [0, 0]]
+        self.assertEqual(
+            interiorPoint({"type": "Polygon", "coordinates": [u]}), [0.5, 2.0]
+        )
+
+        # Avoid the hole, and use the largest polygon
+        self.assertEqual(
+            interiorPoint(
+                {
+                    "type": "MultiPolygon",
+                    "coordinates": [
+                        [[[5, 5], [6, 5], [6, 6], [5, 5]]],
+                        [square(0, 0, 4, 4), square(1, 1, 3, 3)[::-1]],
+                    ],
+                }
+            ),
+            [0.5, 2.0],
+        )
+
+
+def point(count, x, y):
+    return {
+        "type": "Feature",
+        "properties": {"count": count},
+        "geometry": {"type": "Point", "coordinates": [x, y]},
+    }
+
+
+def writeSequence(path, features):
+    with open(path, "w") as f:
+        for feature in features:
+            f.write(json.dumps(feature))
+            f.write("\n")
+
+
+class TestRankFeatures(unittest.TestCase):
+    def test_rankFeatures(self):
+        # Three points close together, and one far away
+        features = [
+            point(10, -1.5, 52.5),
+            point(30, -1.5001, 52.5),
+            point(20, -1.5002, 52.5),
+            point(1, 100, -30),
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "points.geojsonl")
+            writeSequence(path, features)
+            rankedPath = rankFeatures(
+                path, lambda f: f["properties"]["count"], featuresPerTile=1, maxZoom=4
+            )
+            self.assertEqual(rankedPath, os.path.join(tmp, "points_ranked.geojsonl"))
+            self.assertEqual(
+                [
+                    (f["properties"]["count"], f["tippecanoe"]["minzoom"])
+                    for f in readFeatures(rankedPath)
+                ],
+                # Only one feature fits in each tile, so the busiest point
+                # wins the whole world at zoom 0. The far away point needs zoom
+                # 1, and the other two are too close to separate by zoom 4.
+                [(10, 4), (30, 0), (20, 4), (1, 1)],
+            )
+            # The input is untouched
+            self.assertEqual(list(readFeatures(path)), features)
+
+    # Runs convertGeoJsonToPmtiles without tippecanoe, returning its command
+    # and the minzooms of the features it would read
+    def convert(self, autoZoom, args):
+        # More than fit in one tile, all in the same tile up to zoom 10
+        features = [point(i, -1.5 + i * 1e-5, 52.5) for i in range(2100)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "counts.geojson")
+            writeFeatureCollection(path, features)
+            calls = []
+
+            def fakeRun(command, cwd=None):
+                minZooms = [
+                    f["tippecanoe"]["minzoom"]
+                    for f in readFeatures(os.path.join(cwd, command[1]))
+                ]
+                calls.append((command, minZooms))
+                open(os.path.join(cwd, "counts.pmtiles"), "w").close()
+
+            with unittest.mock.patch("utils.run", fakeRun):
+                convertGeoJsonToPmtiles(
+                    path,
+                    os.path.join(tmp, "counts.pmtiles"),
+                    autoZoom=autoZoom,
+                    args=args,
+                    importance=lambda f: f["properties"]["count"],
+                )
+
+            # The cleaned layer other stages read has no tippecanoe members,
+            # and the ranked copy is gone
+            self.assertEqual(utils.scratch.cleanedLayers["counts"], path)
+            self.assertEqual(list(readFeatures(path)), features)
+            self.assertEqual(os.listdir(tmp), ["counts.geojson", "counts.pmtiles"])
+            return calls[0]
+
+    def test_convert_auto_zoom(self):
+        command, minZooms = self.convert(True, [])
+        # Dense enough that some features wait for the maximum zoom, which
+        # tippecanoe must not guess below
+        self.assertEqual(max(minZooms), utils.rankMaxZoom)
+        self.assertIn("-zg", command)
+        self.assertIn(f"--smallest-maximum-zoom-guess={utils.rankMaxZoom}", command)
+
+    def test_convert_explicit_max_zoom(self):
+        command, minZooms = self.convert(False, ["--maximum-zoom=3"])
+        self.assertEqual(max(minZooms), 3)
+
+
+class TestOutputManifest(unittest.TestCase):
+    def test_diff(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "output")
+            os.makedirs(f"{output}/areas")
+            manifest = f"{output}/manifest.json"
+            uploaded = f"{output}/uploaded_manifest.json"
+
+            def write(name, contents):
+                with open(f"{output}/{name}", "w") as f:
+                    f.write(contents)
+
+            def run():
+                return writeOutputManifest(output, manifest, uploaded, [uploaded])
+
+            write("a.geojson", "a")
+            write("b.pmtiles", "b")
+            write("areas/c.geojson", "c")
+            # Nothing was uploaded yet
+            self.assertEqual(run(), (["a.geojson", "areas/c.geojson", "b.pmtiles"], []))
+            shutil.copy(manifest, uploaded)
+
+            write("b.pmtiles", "b2")
+            os.remove(f"{output}/areas/c.geojson")
+            write("d.geojson", "d")
+            self.assertEqual(run(), (["b.pmtiles", "d.geojson"], ["areas/c.geojson"]))
+            # Without uploading, the same files are still listed
+            self.assertEqual(run(), (["b.pmtiles", "d.geojson"], ["areas/c.geojson"]))
+
+            with open(manifest) as f:
+                self.assertEqual(
+                    json.load(f)["d.geojson"],
+                    {
+                        "size": 1,
+                        "sha256": "18ac3e7343f016890c510e93f935261169d9e3f565436429830faf0934f4f8e4",
+                    },
+                )
+
+
+class TestCompressOutputs(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = self.tmp.name
+        self.manifest = f"{self.output}/manifest.json"
+        self.contents = {
+            "a.geojson": b'{"type":"FeatureCollection","features":[]}' * 100,
+            "areas/b.json": b"[1, 2, 3]",
+            "c.pmtiles": b"tiles",
+        }
+        os.makedirs(f"{self.output}/areas")
+        for name, contents in self.contents.items():
+            with open(f"{self.output}/{name}", "wb") as f:
+                f.write(contents)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_gzip(self):
+        compressOutputs(self.output, self.manifest)
+        for name in ["a.geojson", "areas/b.json"]:
+            with gzip.open(f"{self.output}/{name}.gz") as f:
+                self.assertEqual(f.read(), self.contents[name])
+        # PMTiles are read with range requests
+        self.assertFalse(os.path.exists(f"{self.output}/c.pmtiles.gz"))
+
+        # The same every time
+        path = f"{self.output}/a.geojson.gz"
+        with open(path, "rb") as f:
+            first = f.read()
+        os.remove(path)
+        compressOutputs(self.output, self.manifest)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), first)
+
+        writeOutputManifest(self.output, self.manifest, None)
+        with open(self.manifest) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["a.geojson.gz"]["content_encoding"], "gzip")
+        self.assertEqual(manifest["a.geojson.gz"]["original"], "a.geojson")
+        self.assertEqual(
+            manifest["a.geojson.gz"]["original_size"], len(self.contents["a.geojson"])
+        )
+        self.assertEqual(manifest["a.geojson.gz"]["size"], len(first))
+        self.assertNotIn("content_encoding", manifest["a.geojson"])
+        # The manifest itself isn't compressed
+        self.assertNotIn("manifest.json.gz", manifest)
+
+    def test_skips_bookkeeping_files(self):
+        uploaded = f"{self.output}/uploaded_manifest.json"
+        with open(uploaded, "w") as f:
+            f.write("{}")
+        compressOutputs(self.output, self.manifest, ignore=[uploaded])
+        self.assertFalse(os.path.exists(f"{uploaded}.gz"))
+
+        # Even a stray compressed copy isn't treated as an output
+        with open(f"{uploaded}.gz", "w") as f:
+            f.write("stale")
+        changed, _ = writeOutputManifest(
+            self.output, self.manifest, uploaded, [uploaded]
+        )
+        self.assertEqual(
+            changed,
+            [
+                "a.geojson",
+                "a.geojson.gz",
+                "areas/b.json",
+                "areas/b.json.gz",
+                "c.pmtiles",
+            ],
+        )
+
+    def test_keeps_newer_copies(self):
+        path = f"{self.output}/areas/b.json"
+        with open(f"{path}.gz", "wb") as f:
+            f.write(b"stale")
+        # Only replaced once the original changes
+        os.utime(path, (1000, 1000))
+        compressOutputs(self.output, self.manifest)
+        with open(f"{path}.gz", "rb") as f:
+            self.assertEqual(f.read(), b"stale")
+
+        os.utime(path, (2000000000, 2000000000))
+        compressOutputs(self.output, self.manifest)
+        with gzip.open(f"{path}.gz") as f:
+            self.assertEqual(f.read(), self.contents["areas/b.json"])
+
+    @unittest.skipUnless(shutil.which("brotli"), "needs the brotli command")
+    def test_brotli(self):
+        compressOutputs(self.output, self.manifest, useBrotli=True)
+        decompressed = subprocess.run(
+            ["brotli", "-d", "-c", f"{self.output}/a.geojson.br"],
+            check=True,
+            capture_output=True,
+        ).stdout
+        self.assertEqual(decompressed, self.contents["a.geojson"])
+
+        writeOutputManifest(self.output, self.manifest, None)
+        with open(self.manifest) as f:
+            entry = json.load(f)["a.geojson.br"]
+        self.assertEqual(entry["content_encoding"], "br")
+        self.assertEqual(entry["original"], "a.geojson")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,15 @@
 import csv
-from collections import defaultdict
+import io
+import zipfile
+from collections import defaultdict, namedtuple
 from utils import *
+from spatial_index import loadAuthorities
 
 
-def makeDftVehicleCounts():
-    tmp = "tmp_vehicle_counts"
-    ensureEmptyTempDirectoryExists(tmp)
+# With includeHistory, each feature also gets the counts from every year, as
+# encoded by encodeHistory
+def makeDftVehicleCounts(tagAuthorities=False, includeHistory=False):
+    tmp = ensureEmptyTempDirectoryExists("tmp_vehicle_counts", estimatedBytes=1 * GB)
 
     run(
         [
@@ -16,51 +20,112 @@ def makeDftVehicleCounts():
             f"{tmp}/dft_traffic_counts_aadf.zip",
         ]
     )
-    run(["unzip", f"{tmp}/dft_traffic_counts_aadf.zip", "-d", tmp])
+    # Stream the CSV out of the .zip, only keeping the latest year per count
+    # point, and only the columns needed
+    latest = {}
+    # Count point to a dictionary from year to (motor vehicles, pedal cycles)
+    history = defaultdict(dict)
+    with zipfile.ZipFile(f"{tmp}/dft_traffic_counts_aadf.zip") as archive:
+        with archive.open("dft_traffic_counts_aadf.csv") as f:
+            for row in csv.DictReader(io.TextIOWrapper(f, encoding="utf-8-sig")):
+                # Only keep England
+                if row["Region_ons_code"][0] != "E":
+                    continue
+                count_point = row["Count_point_id"]
+                year = int(row["Year"])
+                if includeHistory and year not in history[count_point]:
+                    history[count_point][year] = (
+                        int(row["All_motor_vehicles"]),
+                        int(row["Pedal_cycles"]),
+                    )
+                # Keep the first row if there are multiple for the same year
+                if count_point in latest and latest[count_point].year >= year:
+                    continue
+                latest[count_point] = CountPoint(
+                    year,
+                    float(row["Longitude"]),
+                    float(row["Latitude"]),
+                    row["Road_name"],
+                    row["Start_junction_road_name"],
+                    row["End_junction_road_name"],
+                    row["Estimation_method_detailed"],
+                    int(row["All_motor_vehicles"]),
+                    int(row["Pedal_cycles"]),
+                )
 
-    # Group per-year rows by count point
-    rows_per_count_point = defaultdict(list)
-    with open(f"{tmp}/dft_traffic_counts_aadf.csv") as f:
-        for row in csv.DictReader(f):
-            # Only keep England
-            if row["Region_ons_code"][0] != "E":
-                continue
-            rows_per_count_point[row["Count_point_id"]].append(row)
+    def features():
+        for count_point, row in latest.items():
+            location = row.road
+            if row.start_junction:
+                location += f" from {row.start_junction} to {row.end_junction}"
 
-    gj = {
-        "type": "FeatureCollection",
-        "features": [],
-    }
-    for (count_point, rows) in rows_per_count_point.items():
-        # Find the latest year per count point
-        latest = max(rows, key=lambda row: int(row["Year"]))
-        location = latest["Road_name"]
-        if latest["Start_junction_road_name"]:
-            location += f" from {latest['Start_junction_road_name']} to {latest['End_junction_road_name']}"
-
-        gj["features"].append(
-            {
+            feature = {
                 "type": "Feature",
                 "geometry": {
                     "type": "Point",
-                    "coordinates": [
-                        float(latest["Longitude"]),
-                        float(latest["Latitude"]),
-                    ],
+                    "coordinates": [row.longitude, row.latitude],
                 },
                 "properties": {
-                    "count_point": latest["Count_point_id"],
+                    "count_point": count_point,
                     "location": location,
-                    "method": latest["Estimation_method_detailed"],
-                    "motor_vehicles": int(latest["All_motor_vehicles"]),
-                    "pedal_cycles": int(latest["Pedal_cycles"]),
-                    "year": int(latest["Year"]),
+                    "method": row.method,
+                    "motor_vehicles": row.motor_vehicles,
+                    "pedal_cycles": row.pedal_cycles,
+                    "year": row.year,
                 },
             }
-        )
+            if includeHistory:
+                years = history[count_point]
+                startYear = min(years)
+                feature["properties"]["history_start_year"] = startYear
+                for idx, key in enumerate(["motor_vehicles", "pedal_cycles"]):
+                    feature["properties"][f"{key}_history"] = encodeHistory(
+                        startYear,
+                        row.year,
+                        {year: counts[idx] for year, counts in years.items()},
+                    )
+            if tagAuthorities:
+                loadAuthorities().tagFeature(feature)
+            yield feature
 
-    with open(f"{tmp}/vehicle_counts.geojson", "w") as f:
-        f.write(json.dumps(gj))
+    writeFeatureCollection(f"{tmp}/vehicle_counts.geojson", features())
     convertGeoJsonToPmtiles(
-        f"{tmp}/vehicle_counts.geojson", "output/vehicle_counts.pmtiles", autoZoom=True
+        f"{tmp}/vehicle_counts.geojson",
+        "output/vehicle_counts.pmtiles",
+        autoZoom=True,
+        importance=lambda f: f["properties"]["motor_vehicles"],
     )
+
+
+# The columns used from the latest row of each count point
+CountPoint = namedtuple(
+    "CountPoint",
+    [
+        "year",
+        "longitude",
+        "latitude",
+        "road",
+        "start_junction",
+        "end_junction",
+        "method",
+        "motor_vehicles",
+        "pedal_cycles",
+    ],
+)
+
+
+# Encodes one count per year from startYear to endYear as a short string. The
+# first count is written in full, and each later one as the difference from the
+# previous count. Years without a count are left empty. For example, 100 in
+# 2019, nothing in 2020, and 120 in 2021 becomes "100,,20".
+def encodeHistory(startYear, endYear, counts):
+    values = []
+    previous = None
+    for year in range(startYear, endYear + 1):
+        if year not in counts:
+            values.append("")
+            continue
+        count = counts[year]
+        values.append(str(count if previous is None else count - previous))
+        previous = count
+    return ",".join(values)
@@ -0,0 +1,24 @@
+import unittest
+
+from vehicle_counts import encodeHistory
+
+
+class TestEncodeHistory(unittest.TestCase):
+    def test_encodeHistory(self):
+        # The first count is in full, then differences from the previous count
+        self.assertEqual(
+            encodeHistory(2019, 2021, {2019: 100, 2020: 90, 2021: 120}), "100,-10,30"
+        )
+        # Missing years are empty, and differences skip over them
+        self.assertEqual(encodeHistory(2019, 2021, {2019: 100, 2021: 120}), "100,,20")
+        self.assertEqual(encodeHistory(2000, 2000, {2000: 5}), "5")
+
+    def test_range(self):
+        # Years outside the range are ignored, and the range can start or end
+        # without a count
+        counts = {2017: 1, 2019: 100, 2020: 110, 2023: 7}
+        self.assertEqual(encodeHistory(2018, 2021, counts), ",100,10,")
+
+
+if __name__ == "__main__":
+    unittest.main()